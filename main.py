@@ -1,6 +1,6 @@
 import os
+import re
 import json
-import base64
 import asyncio
 import websockets
 import urllib.parse
@@ -18,15 +18,50 @@ from typing import Optional
 from twilio.rest import Client
 from twilio.twiml.voice_response import VoiceResponse, Connect, Redirect, Dial, Stream
 from dotenv import load_dotenv
-import uuid
 import logging
 import time
 import redis
+import redis.asyncio as aioredis
 from datetime import datetime
 
-from openai import OpenAI
-from qdrant_client import QdrantClient
+from openai import AsyncOpenAI
+from qdrant_client import AsyncQdrantClient
 from src.assets.prompts import DEFAULT_INTRO, SYSTEM_MESSAGE
+from src.utils.audio import load_ulaw, play_frames, ulaw_frames
+from src.utils.audio_relay import (
+    InboundAudioBatcher,
+    PlaybackTracker,
+    TwilioMediaTemplate,
+    conversation_item_truncate,
+    loads,
+    openai_audio_delta,
+    openai_item_id,
+    twilio_media_payload,
+)
+from src.utils.bm25 import BM25_INDEX_PATH, BM25Index, reciprocal_rank_fusion
+from src.utils.chunker import get_encoding
+from src.utils.extractive import extractive_answer
+from src.utils.embeddings import (
+    AsyncEmbeddingService,
+    EmbeddingCache,
+    RedisEmbeddingStore,
+)
+from src.utils.local_index import LOCAL_INDEX_PATH, LocalVectorIndex
+from src.utils.metrics import metrics
+from src.utils.phrase_cache import PHRASE_CACHE, PhraseCache, PhraseCapture
+from src.utils.prefetch import RAG_PREFETCH, RetrievalPrefetch
+from src.utils.prompt_packer import pack_messages
+from src.utils.realtime_pool import RealtimePool
+from src.utils.semantic_cache import (
+    QueryKeyStats,
+    SemanticCache,
+    caller_words,
+    canonical_query,
+    generation_key,
+)
+from src.utils.silence_gate import SILENCE_GATE, SilenceGate
+from src.utils.session_store import InMemorySessionStore, RedisSessionStore
+from src.utils.sessions import SessionRegistry, session_id_for_call
 
 load_dotenv()
 
@@ -44,6 +79,23 @@ if not OPENAI_API_KEY:
     raise ValueError("Missing the OpenAI API key. Please set it in the .env file.")
 PORT = int(os.getenv("PORT", 5050))
 PERSONAL_PHONE_NUMBER = os.getenv("PERSONAL_PHONE_NUMBER")
+REALTIME_URL = (
+    "wss://api.openai.com/v1/realtime?model=gpt-4o-realtime-preview-2024-10-01"
+)
+COLLECTION_NAME = "respiratory_disease_guide"
+# "qdrant" searches the hosted cluster, "local" an in-process copy of it
+RAG_BACKEND = os.getenv("RAG_BACKEND", "qdrant")
+# "hybrid" fuses BM25 and vector hits, "vector" uses the vector search alone
+RAG_RETRIEVAL = os.getenv("RAG_RETRIEVAL", "hybrid")
+RAG_CANDIDATES = int(os.getenv("RAG_CANDIDATES", 10))  # hits per retriever
+RAG_CONTEXT_CHUNKS = int(os.getenv("RAG_CONTEXT_CHUNKS", 3))  # chunks per prompt
+RAG_CACHE_SIMILARITY = float(os.getenv("RAG_CACHE_SIMILARITY", 0.95))
+RAG_CACHE_TTL = int(os.getenv("RAG_CACHE_TTL", 3600))
+RAG_CACHE_MAX_ENTRIES = int(os.getenv("RAG_CACHE_MAX_ENTRIES", 1024))
+# "redis" shares sessions across workers, "memory" keeps them in this process
+SESSION_STORE = os.getenv("SESSION_STORE", "redis")
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 32))  # per worker
+REDIS_TIMEOUT = float(os.getenv("REDIS_TIMEOUT", 2.0))  # seconds
 
 ##############################################################
 ##############################################################
@@ -51,40 +103,145 @@ PERSONAL_PHONE_NUMBER = os.getenv("PERSONAL_PHONE_NUMBER")
 ##############################################################
 ##############################################################
 
-client_openai = OpenAI()
+# Async clients: lookups run on the event loop, so a slow query must never
+# stall the audio relay of the other calls served by this worker
+client_openai = AsyncOpenAI()
 
-vectordb_client = QdrantClient(
+vectordb_client = AsyncQdrantClient(
     url=os.getenv("QDRANT_URL"), api_key=os.getenv("QDRANT_API_KEY")
 )
 
+# Only used from worker threads (embedding cache lookups)
 redis_client = redis.Redis(
     host=redis_url.hostname,
     port=redis_url.port,
     password=redis_url.password,
     ssl=True,
     ssl_cert_reqs=None,
+    socket_timeout=REDIS_TIMEOUT,
+    socket_connect_timeout=REDIS_TIMEOUT,
+)
+
+# Content-addressed, so repeated queries never hit the embeddings API twice
+embedding_service = AsyncEmbeddingService(
+    client_openai, EmbeddingCache(RedisEmbeddingStore(redis_client))
+)
+
+async_redis_client = None
+
+
+def get_async_redis():
+    """
+    The worker's asyncio Redis client, created on first use so its pool is
+    never shared by forked workers. Callers beyond REDIS_MAX_CONNECTIONS wait
+    for a free connection instead of opening more.
+    """
+    global async_redis_client
+    if async_redis_client is None:
+        pool = aioredis.BlockingConnectionPool(
+            connection_class=aioredis.SSLConnection,
+            host=redis_url.hostname,
+            port=redis_url.port,
+            password=redis_url.password,
+            ssl_cert_reqs=None,
+            max_connections=REDIS_MAX_CONNECTIONS,
+            timeout=REDIS_TIMEOUT,
+            socket_timeout=REDIS_TIMEOUT,
+            socket_connect_timeout=REDIS_TIMEOUT,
+            health_check_interval=30,
+        )
+        async_redis_client = aioredis.Redis(connection_pool=pool)
+    return async_redis_client
+
+
+# Shared across workers through Redis, dropped whenever the collection is rebuilt
+answer_cache = SemanticCache(
+    COLLECTION_NAME,
+    threshold=RAG_CACHE_SIMILARITY,
+    ttl=RAG_CACHE_TTL,
+    max_entries=RAG_CACHE_MAX_ENTRIES,
+    redis_client=get_async_redis,
 )
+# How often different expanded queries share one canonical cache key
+query_keys = QueryKeyStats()
 
 twilio_client = Client(account_sid, auth_token)
 
 app = FastAPI()
 
+
+async def connect_realtime():
+    return await websockets.connect(
+        REALTIME_URL,
+        extra_headers={
+            "Authorization": f"Bearer {OPENAI_API_KEY}",
+            "OpenAI-Beta": "realtime=v1",
+        },
+    )
+
+
+# Connections configured ahead of calls, claimed by the incoming-call webhook
+realtime_pool = RealtimePool(
+    connect_realtime, lambda openai_ws: configure_realtime_session(openai_ws)
+)
+
+
+@app.on_event("startup")
+async def start_realtime_pool():
+    realtime_pool.start()
+
+
+@app.on_event("startup")
+async def load_tokenizer():
+    # The first load reads (or downloads) the tokenizer files, too slow for
+    # the event loop of the first call that packs a prompt
+    await asyncio.to_thread(get_encoding)
+
+
+search_index_task = None
+
+
+@app.on_event("startup")
+async def start_search_indexes():
+    global search_index_task
+    if RAG_BACKEND == "local" or RAG_RETRIEVAL == "hybrid":
+        search_index_task = asyncio.create_task(keep_search_indexes_fresh())
+
+
+@app.on_event("shutdown")
+async def close_realtime_pool():
+    await realtime_pool.close()
+
+
+@app.on_event("shutdown")
+async def stop_search_indexes():
+    if search_index_task is not None:
+        search_index_task.cancel()
+
 ##############################################################
 ##############################################################
 ################# INITIALISING LOCAL VARS ####################
 ##############################################################
 ##############################################################
 
-CURR_SESSION_ID = '6c88023c-230c-4be6-ba34-26f83db6cb64'  # Track current session for frontend to join
 active_connections = []
 
-conversation_histories = {}  # for session history
-
-conversation_summaries = {}  # for summaries
-session_caller_numbers = {}
+# History, summary, caller number and transfer state of every call. The
+# lambda defers the lookup of summarize_turns, defined with the RAG helpers
+sessions = SessionRegistry(
+    lambda summary, turns: summarize_turns(summary, turns),
+    store=(
+        RedisSessionStore(get_async_redis)
+        if SESSION_STORE == "redis"
+        else InMemorySessionStore()
+    ),
+)
 
 # LOGGER
 VOICE = "alloy"
+# Server VAD settings, also what the local silence gate must preserve
+VAD_PREFIX_PADDING_MS = 300
+VAD_SILENCE_DURATION_MS = 500
 LOG_EVENT_TYPES = [
     "response.content.done",
     "response.done",
@@ -101,6 +258,10 @@ logger = logging.getLogger(__name__)
 # MOUNT TYPING SOUND
 current_dir = os.path.dirname(__file__)
 mp3_file_path = os.path.join(current_dir, "static", "typing.wav")
+# Transcoded and framed once, so tool calls never touch the disk
+TYPING_FRAMES = ulaw_frames(load_ulaw(mp3_file_path))
+# Introductions spoken by the model once, replayed on later calls
+phrase_cache = PhraseCache()
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 
@@ -120,15 +281,16 @@ async def handle_incoming_call(
     )
     caller_number = form_data.get("From", "Unknown")
     logger.info(f"Caller: {caller_number}")
+    call_id = form_data.get("CallSid")
     # session_id = create_session(api_key, project_id, caller_number)
-    session_id = create_session(api_key, caller_number)
-    session_caller_numbers[session_id] = caller_number  # check
+    session_id = await create_session(api_key, caller_number, call_id)
     # logger.info(f"Project::{project_id}")
     logger.info(f"Incoming call handled. Session ID: {session_id}")
     host = request.url.hostname
-    call_id = form_data.get("CallSid")
     response = VoiceResponse()
-    response.pause(length=1)
+    # Without a warm Realtime connection, give the stream time to set one up
+    if not realtime_pool.claim(session_id):
+        response.pause(length=1)
     connect = Connect()
     phone_number = PERSONAL_PHONE_NUMBER
     encoded_phone_number = urllib.parse.quote_plus(phone_number)
@@ -165,9 +327,13 @@ async def handle_end_call(
     session_id: Optional[str] = None,
     phone_number: Optional[str] = None,
 ):
-    state = redis_client.get(session_id)
-    if state:
-        state = state.decode("utf-8")
+    session = sessions.get(session_id)
+    if session is not None and session.transfer:
+        state = "transfer"
+    else:
+        # The call may have been streamed by another worker
+        record = await sessions.record(session_id)
+        state = "transfer" if record and record["transfer"] else None
     logger.info(f"Ending Stream with state: {state}")
     response = VoiceResponse()
     if state == "transfer":
@@ -188,22 +354,74 @@ async def handle_media_stream(
     logger.info(f"WebSocket connection attempt. Session ID: {session_id}")
     await websocket.accept()
     logger.info(f"WebSocket connection accepted. Session ID: {session_id}")
+    # The webhook that created the session may have hit another worker
+    session = await sessions.open(session_id)
+    first_audio = False  # set once the caller hears the introduction
+    introduction = introduction.replace("+", " ")
+    intro_frames = phrase_cache.get(introduction, VOICE) if PHRASE_CACHE else None
+    # Without cached audio, the model's introduction is captured for next time
+    intro_capture = (
+        PhraseCapture(introduction, VOICE)
+        if PHRASE_CACHE and intro_frames is None
+        else None
+    )
+    intro_stop = asyncio.Event()
+    if RAG_PREFETCH:
+        # Searches for what the caller said before the tool call asks
+        session.prefetch = RetrievalPrefetch(
+            embedding_service.embed, search_knowledge_base
+        )
     api_key = None
     # Create task termination event
     termination_event = asyncio.Event()
+    # Tracks whether the Realtime session is generating a response,
+    # since response.create is rejected while one is in progress
+    response_idle = asyncio.Event()
+    response_idle.set()
+    # Set to stop the typing sound of the knowledge base lookup in progress
+    typing_stop = asyncio.Event()
+    typing_stop.set()
+    context_tasks = set()
+    tool_call_timer = None  # (mode, started) until the answer is audible
+    media_template = None  # Twilio media messages of the current stream
+    playback = PlaybackTracker()  # what the caller has heard of the answer
+
+    async with realtime_pool.connection(session_id) as openai_ws:
+
+        async def send_audio_to_openai(message):
+            if openai_ws.open:
+                await openai_ws.send(message)
+
+        # Joins inbound 20 ms frames into fewer, larger appends
+        inbound_audio = InboundAudioBatcher(send_audio_to_openai)
+        # Holds back long silences, with margin over what server VAD needs
+        silence_gate = (
+            SilenceGate(
+                prefix_ms=VAD_PREFIX_PADDING_MS + 100,
+                hangover_ms=VAD_SILENCE_DURATION_MS + 300,
+            )
+            if SILENCE_GATE
+            else None
+        )
+
+        async def forward_inbound_audio(payload):
+            if silence_gate is None:
+                await inbound_audio.add(payload)
+                return
+            for frame in silence_gate.process(payload):
+                await inbound_audio.add(frame)
 
-    async with websockets.connect(
-        "wss://api.openai.com/v1/realtime?model=gpt-4o-realtime-preview-2024-10-01",
-        extra_headers={
-            "Authorization": f"Bearer {OPENAI_API_KEY}",
-            "OpenAI-Beta": "realtime=v1",
-        },
-    ) as openai_ws:
         try:
             handle_first_response = time.time()
             start_time = time.time()
             stream_sid = None
-            await send_session_update(openai_ws, phone_number, introduction)
+            await send_session_update(
+                openai_ws, phone_number, introduction, spoken=intro_frames is not None
+            )
+            if intro_frames is not None:
+                await sessions.append_turn(
+                    session_id, {"role": "assistant", "content": introduction}
+                )
 
             async def check_timeout():
                 logger.info(f"Checking inactivity. Session ID: {session_id}")
@@ -225,28 +443,132 @@ async def handle_media_stream(
 
             asyncio.create_task(check_timeout())
 
+            async def wait_response_idle():
+                try:
+                    await asyncio.wait_for(response_idle.wait(), timeout=5)
+                except asyncio.TimeoutError:
+                    logger.warning("Timed out waiting for active response to finish")
+
+            async def send_context_output(
+                call_id, result, instructions=None, respond=True
+            ):
+                function_response = {
+                    "type": "conversation.item.create",
+                    "item": {
+                        "type": "function_call_output",
+                        "call_id": call_id,
+                        "output": result,
+                    },
+                }
+                await openai_ws.send(json.dumps(function_response))
+                if not respond:
+                    return
+                response_create = {"type": "response.create"}
+                if instructions:
+                    response_create["response"] = {"instructions": instructions}
+                await openai_ws.send(json.dumps(response_create))
+
+            async def answer_context_call(call_id, query, typing_stop):
+                nonlocal tool_call_timer
+                started = time.time()
+                mode = "streaming" if RAG_STREAMING else "blocking"
+                tool_call_timer = (mode, started)
+                if session.prefetch is not None:
+                    session.prefetch.outcome = None
+                try:
+                    if not RAG_STREAMING:
+                        result = await get_additional_context(
+                            query, api_key, session_id
+                        )
+                        logger.info(f"Clear Audio::Additional Context gained")
+                        typing_stop.set()
+                        await clear_buffer(websocket, openai_ws, stream_sid)
+                        await send_context_output(call_id, result)
+                    else:
+                        # Speak the first sentence as soon as it is generated,
+                        # then hand the model the full answer to continue from
+                        result = ""
+                        spoken = None
+                        async for delta in stream_additional_context(
+                            query, api_key, session_id
+                        ):
+                            result += delta
+                            if spoken is None:
+                                spoken = first_sentence(result)
+                                if spoken:
+                                    typing_stop.set()
+                                    await wait_response_idle()
+                                    await clear_buffer(websocket, openai_ws, stream_sid)
+                                    await openai_ws.send(
+                                        json.dumps(
+                                            {
+                                                "type": "response.create",
+                                                "response": {
+                                                    "instructions": f"Say exactly the following to the caller and nothing else: {spoken}"
+                                                },
+                                            }
+                                        )
+                                    )
+                        result = result.strip()
+                        await wait_response_idle()
+                        if not spoken:
+                            typing_stop.set()
+                            await clear_buffer(websocket, openai_ws, stream_sid)
+                            await send_context_output(call_id, result)
+                        elif result != spoken:
+                            await send_context_output(
+                                call_id,
+                                result,
+                                instructions=f'You have already told the caller: "{spoken}". Continue the answer from the function output without repeating that sentence.',
+                            )
+                        else:
+                            # Whole answer already spoken; just record the output
+                            await send_context_output(call_id, result, respond=False)
+                    logger.info(
+                        f"get_additional_context execution time ({mode}): {time.time() - started:.4f} seconds"
+                    )
+                except Exception as e:
+                    logger.error(f"Error answering get_additional_context: {e}")
+                finally:
+                    typing_stop.set()
+
             async def receive_from_twilio():
                 nonlocal stream_sid, start_time, api_key
                 while not termination_event.is_set():
                     try:
                         message = await websocket.receive_text()
-                        data = json.loads(message)
-                        if data["event"] == "media" and openai_ws.open:
-                            audio_append = {
-                                "type": "input_audio_buffer.append",
-                                "audio": data["media"]["payload"],
-                            }
-                            await openai_ws.send(json.dumps(audio_append))
+                        # Audio frames are forwarded without being parsed
+                        payload = twilio_media_payload(message)
+                        if payload is not None:
+                            await forward_inbound_audio(payload)
+                            continue
+                        data = loads(message)
+                        if data["event"] == "media":
+                            await forward_inbound_audio(data["media"]["payload"])
+                        elif data["event"] == "mark":
+                            playback.played(data["mark"]["name"])
+                        elif data["event"] == "stop":
+                            await inbound_audio.flush()
                         elif data["event"] == "start":
                             api_key = data["start"]["customParameters"]["api_key"]
                             stream_sid = data["start"]["streamSid"]
                             start_time = time.time()
                             logger.info(f"Incoming stream has started {stream_sid}")
+                            if intro_frames is not None:
+                                intro = asyncio.create_task(
+                                    play_phrase(
+                                        websocket, stream_sid, intro_frames, intro_stop
+                                    )
+                                )
+                                context_tasks.add(intro)
+                                intro.add_done_callback(context_tasks.discard)
+                                note_first_audio()
                         elif data["event"] == "dtmf":
+                            await inbound_audio.flush()
                             digit = data["dtmf"]["digit"]
                             logger.info(f"DTMF received: {digit}")
                             if digit == "0":
-                                redis_client.set(session_id, "transfer")
+                                await sessions.mark_transfer(session_id)
                                 logger.info("DTMF '0' detected, redirecting call...")
                                 termination_event.set()
                                 await websocket.close()
@@ -263,7 +585,7 @@ async def handle_media_stream(
                             f"Conversation Summary for Session {session_id}: {summary}"
                         )
                         print(
-                            f"Conversation History for Session {session_id}: {conversation_histories[session_id]}"
+                            f"Conversation History for Session {session_id}: {get_conversation_memory(session_id)}"
                         )
                         break
                     except RuntimeError as e:
@@ -278,12 +600,62 @@ async def handle_media_stream(
                         logger.error(f"Error in receive_from_twilio: {e}")
                         break
 
+            def note_first_audio():
+                nonlocal first_audio
+                if not first_audio:
+                    first_audio = True
+                    pickup = time.time() - session.created_at
+                    metrics.observe("call.pickup_to_first_audio", pickup)
+                    logger.info(
+                        f"First audio {pickup:.2f}s after pickup. Session ID: {session_id}"
+                    )
+
+            async def relay_audio(payload, item_id=None):
+                nonlocal start_time, tool_call_timer, media_template
+                try:
+                    if (
+                        media_template is None
+                        or media_template.stream_sid != stream_sid
+                    ):
+                        media_template = TwilioMediaTemplate(stream_sid)
+                    await websocket.send_text(media_template.render(payload))
+                    if item_id:
+                        await websocket.send_text(
+                            media_template.mark(playback.sent(item_id, payload))
+                        )
+                    start_time = time.time()
+                    note_first_audio()
+                    if intro_capture is not None and item_id:
+                        intro_capture.add(item_id, payload)
+                    if tool_call_timer:
+                        mode, started = tool_call_timer
+                        tool_call_timer = None
+                        prefetched = (
+                            session.prefetch is not None
+                            and session.prefetch.outcome == "hit"
+                        )
+                        metrics.observe(
+                            f"tool_call.time_to_first_audio.{mode}"
+                            f".{'prefetch' if prefetched else 'no_prefetch'}",
+                            time.time() - started,
+                        )
+                except asyncio.TimeoutError:
+                    logger.error("Timeout while sending audio data to Twilio")
+                except Exception as e:
+                    logger.error(f"Error processing audio data: {e}")
+
             async def send_to_twilio():
-                nonlocal stream_sid, start_time
+                nonlocal stream_sid, start_time, typing_stop
+                nonlocal intro_capture
                 try:
                     async for openai_message in openai_ws:
+                        # Audio deltas are relayed without being parsed
+                        delta = openai_audio_delta(openai_message)
+                        if delta is not None:
+                            await relay_audio(delta, openai_item_id(openai_message))
+                            continue
                         try:
-                            response = json.loads(openai_message)
+                            response = loads(openai_message)
                             start_time = time.time()
                             if response["type"] in LOG_EVENT_TYPES:
                                 logger.info(
@@ -291,9 +663,46 @@ async def handle_media_stream(
                                 )
                             if response["type"] == "session.updated":
                                 logger.info(f"Session updated successfully: {response}")
+                            if (
+                                response["type"]
+                                == "conversation.item.input_audio_transcription.completed"
+                                and session.prefetch is not None
+                            ):
+                                session.prefetch.start(response.get("transcript", ""))
                             if response["type"] == "input_audio_buffer.speech_started":
                                 logger.info(f"Input Audio Detected::{response}")
+                                # The caller is talking over us: get the rest of
+                                # their speech to the model without delay
+                                await inbound_audio.flush()
+                                typing_stop.set()
+                                intro_stop.set()
+                                if session.prefetch is not None:
+                                    # Searched for words the caller is now
+                                    # adding to or taking back
+                                    session.prefetch.cancel()
+                                cut = playback.interrupt()
                                 await clear_buffer(websocket, openai_ws, stream_sid)
+                                if cut:
+                                    # Drop what the caller never heard, so it is
+                                    # not carried as context into later turns
+                                    item_id, audio_end_ms = cut
+                                    logger.info(
+                                        f"Truncating {item_id} at {audio_end_ms} ms"
+                                    )
+                                    await openai_ws.send(
+                                        conversation_item_truncate(item_id, audio_end_ms)
+                                    )
+                            if response["type"] == "response.created":
+                                response_idle.clear()
+                            if response["type"] == "response.done":
+                                response_idle.set()
+                                if intro_capture is not None:
+                                    audio = intro_capture.result(response["response"])
+                                    intro_capture = None
+                                    if audio:
+                                        await asyncio.to_thread(
+                                            phrase_cache.put, introduction, VOICE, audio
+                                        )
 
                             if response.get("type") == "response.done":
                                 output_items = response['response'].get('output', [])
@@ -312,31 +721,15 @@ async def handle_media_stream(
                                                 # Only process items with a role ('assistant' or 'user') or handle function calls
                                                 if role == 'assistant':
                                                     if assistant_text:
-                                                        if session_id not in conversation_histories:
-                                                            conversation_histories[session_id] = []
-                                                        conversation_histories[session_id].append({"role": role if role else "unknown", "content": assistant_text})
+                                                        await sessions.append_turn(session_id, {"role": role if role else "unknown", "content": assistant_text})
                                                         print("Adding response into conversation history from response.done")
 
                             if response[
                                 "type"
                             ] == "response.audio.delta" and response.get("delta"):
-                                try:
-                                    audio_payload = base64.b64encode(
-                                        base64.b64decode(response["delta"])
-                                    ).decode("utf-8")
-                                    audio_delta = {
-                                        "event": "media",
-                                        "streamSid": stream_sid,
-                                        "media": {"payload": audio_payload},
-                                    }
-                                    await websocket.send_json(audio_delta)
-                                    start_time = time.time()
-                                except asyncio.TimeoutError:
-                                    logger.error(
-                                        "Timeout while sending audio data to Twilio"
-                                    )
-                                except Exception as e:
-                                    logger.error(f"Error processing audio data: {e}")
+                                await relay_audio(
+                                    response["delta"], response.get("item_id")
+                                )
                             if (
                                 response["type"]
                                 == "response.function_call_arguments.done"
@@ -346,54 +739,43 @@ async def handle_media_stream(
                                     call_id = response["call_id"]
                                     arguments = json.loads(response["arguments"])
                                     if function_name == "get_additional_context":
-                                        await play_typing(websocket, stream_sid)
+                                        # Loops until the answer is ready
+                                        typing_stop.set()
+                                        typing_stop = asyncio.Event()
+                                        typing = asyncio.create_task(
+                                            play_typing(
+                                                websocket, stream_sid, typing_stop
+                                            )
+                                        )
+                                        context_tasks.add(typing)
+                                        typing.add_done_callback(context_tasks.discard)
                                         logger.info("Query to KB Started")
                                         start_time = time.time()
                                         
                                         # Store the user's query
-                                        if session_id not in conversation_histories:
-                                            conversation_histories[session_id] = []
-                                        conversation_histories[session_id].append(
+                                        await sessions.append_turn(
+                                            session_id,
                                             {
                                                 "role": "user",
                                                 "content": arguments["query"],
                                             }
                                         )
                                         print("Adding user query into conversation history when calling RAG")
-                                        
-                                        result = get_additional_context(
-                                            arguments["query"], api_key, session_id
-                                        )
-                                        logger.info(
-                                            f"Clear Audio::Additional Context gained"
-                                        )
-                                        await clear_buffer(
-                                            websocket, openai_ws, stream_sid
-                                        )
-                                        end_time = time.time()
-                                        elapsed_time = end_time - start_time
-                                        logger.info(
-                                            f"get_additional_context execution time: {elapsed_time:.4f} seconds"
-                                        )
-                                        function_response = {
-                                            "type": "conversation.item.create",
-                                            "item": {
-                                                "type": "function_call_output",
-                                                "call_id": call_id,
-                                                "output": result,
-                                            },
-                                        }
-                                        await openai_ws.send(
-                                            json.dumps(function_response)
-                                        )
-                                        await openai_ws.send(
-                                            json.dumps({"type": "response.create"})
+
+                                        # Answer off the receive loop so response
+                                        # lifecycle events keep flowing meanwhile
+                                        task = asyncio.create_task(
+                                            answer_context_call(
+                                                call_id, arguments["query"], typing_stop
+                                            )
                                         )
+                                        context_tasks.add(task)
+                                        task.add_done_callback(context_tasks.discard)
                                     elif function_name == "call_support":
                                         logger.info(
                                             "Detected Term for calling support..."
                                         )
-                                        redis_client.set(session_id, "transfer")
+                                        await sessions.mark_transfer(session_id)
                                         termination_event.set()
                                         raise Exception("Close Stream")
 
@@ -405,7 +787,7 @@ async def handle_media_stream(
                                     logger.error(f"Error in function_call.done: {e}")
                                     raise Exception("Close Stream")
 
-                        except json.JSONDecodeError as e:
+                        except ValueError as e:
                             logger.error(
                                 f"Error in json decode of response: {e}::{openai_message}"
                             )
@@ -429,6 +811,15 @@ async def handle_media_stream(
             logger.error(f"Unexpected error in handle_media_stream: {e}")
 
         finally:
+            for task in list(context_tasks):
+                task.cancel()
+            # The summary is saved by now, and the transfer flag is stored
+            sessions.release(session_id)
+            if silence_gate is not None:
+                logger.info(
+                    f"Silence gate dropped {silence_gate.frames_dropped} frames"
+                    f" ({silence_gate.bytes_saved} bytes). Session ID: {session_id}"
+                )
             try:
                 await clear_buffer(websocket, openai_ws, stream_sid)
                 await openai_ws.close()
@@ -455,12 +846,18 @@ def start_recording(call_id: str, session_id: str, host: str):
 
 
 ### VECTOR BASED RAG
-def get_additional_context(query, api_key, session_id):
-    # Initialize conversation history for new sessions
-    if session_id not in conversation_histories:
-        conversation_histories[session_id] = []
-
-    custom_persona = """
+RAG_MAX_RETRIES = 2
+RAG_RETRY_BACKOFF = 0.5  # seconds, doubled on every retry
+# Speak the first sentence of a knowledge-base answer while the rest generates
+RAG_STREAMING = os.getenv("RAG_STREAMING", "true").lower() == "true"
+RAG_FALLBACK_ANSWER = "Sorry, I didn't get your query."
+# Seconds a caller waits for a knowledge-base answer before getting an
+# extractive one, cut from the top retrieved chunk
+RAG_DEADLINE = float(os.getenv("RAG_DEADLINE", 2.5))
+# Let answers that miss the deadline finish, so the cache has them next time
+RAG_LATE_ANSWERS = os.getenv("RAG_LATE_ANSWERS", "true").lower() == "true"
+
+RAG_PERSONA = """
     You are an AI assistant tasked with answering user queries based on a knowledge base. The user query is transcribed from voice audio, so there may be transcription errors.
 
     When responding to the user query, follow these guidelines:
@@ -470,89 +867,328 @@ def get_additional_context(query, api_key, session_id):
     Provide a concise answer, limited to three sentences.
     """
 
+
+def retrieval_query(query):
+    """Canonical short form of a tool query, for embedding and caching."""
+    canonical = canonical_query(query) or query
+    query_keys.record(query, canonical)
+    return canonical
+
+
+def build_context_messages(query, search_result, session_id, history=False):
+    """
+    Prompt for the knowledge base answer. Shared answers are cached for every
+    caller, so only those of the caller's own follow-ups (`history`) are
+    written with their turns and summary of the call.
+    """
+    turns, summary = [], None
+    session = sessions.get(session_id) if history else None
+    if session is not None:  # answers arriving after hang-up go without
+        turns, summary = list(session.memory), session.memory.summary
+    messages, stats = pack_messages(
+        RAG_PERSONA,
+        query,
+        turns,
+        [(hit.payload["text"], hit.score) for hit in search_result],
+        summary=summary,
+    )
+    logger.info(
+        f"RAG prompt for session {session_id}: {stats['tokens']} tokens,"
+        f" {stats['contexts']} context chunks, {stats['turns']} turns"
+        f" ({stats['dropped_turns']} dropped)"
+    )
+    return messages
+
+
+late_answers = set()  # lookups still running past their deadline
+
+
+def finish_late(task):
+    """Let a lookup that missed its deadline run on to cache its answer."""
+    if not RAG_LATE_ANSWERS:
+        task.cancel()
+        return
+    late_answers.add(task)
+    task.add_done_callback(late_answers.discard)
+
+
+def deadline_answer(canonical, retrieved, outcome):
+    """Answer cut from the top chunk retrieved so far, counted under `outcome`."""
+    metrics.incr(f"rag.deadline.{outcome}")
+    logger.info(f"Knowledge base answer {outcome}, answering extractively")
+    if retrieved and retrieved[-1]:
+        answer = extractive_answer(canonical, retrieved[-1][0].payload["text"])
+        if answer:
+            return answer
+    return RAG_FALLBACK_ANSWER
+
+
+async def get_additional_context(query, api_key, session_id):
     # Set API key
     client_openai.api_key = api_key
 
+    # Cached under the caller's own words, so answered from them alone: the
+    # rest of the expansion may hold details of this caller only. Without
+    # such words the query leans on the call so far, and is answered for
+    # this caller only
+    canonical = retrieval_query(query)
+    words = caller_words(query)
+    shared = words is not None
+    query = words or query
+    retrieved = []  # search results, for an answer past the deadline
+
+    task = asyncio.create_task(
+        answer_with_retries(query, canonical, session_id, retrieved, shared)
+    )
+    try:
+        answer = await asyncio.wait_for(asyncio.shield(task), RAG_DEADLINE)
+    except asyncio.TimeoutError:
+        return deadline_answer(canonical, retrieved, "fallback")
+    finally:
+        if not task.done():
+            finish_late(task)
+    if answer is None:
+        return deadline_answer(canonical, retrieved, "error")
+    metrics.incr("rag.deadline.on_time")
+    return answer
+
+
+async def answer_with_retries(query, canonical, session_id, retrieved, shared=True):
+    """
+    The knowledge-base answer to `query`, or None if every try failed.
+    Only `shared` answers go through the cache, the others use the history.
+    """
     # Retry logic
     tries = 0
-    max_retries = 2
-    while tries <= max_retries:
+    while tries <= RAG_MAX_RETRIES:
         try:
             logger.info(f"OpenAI API query sent:: {query}")
-            # Retrieve contexts from the Qdrant vector database
-            retrieved_contexts = query_qdrant(query)
-            context_text = "\n".join(retrieved_contexts)
-            logger.info(f"Qdrant context retrieved: {context_text}")
-
-            # Construct the conversation messages
-            messages = [
-                {"role": "system", "content": custom_persona},
-                {"role": "system", "content": f"Retrieved Context: {context_text}"},
-                {"role": "user", "content": query},
-            ]
-
-            # Add conversation history
-            messages.extend(conversation_histories[session_id])
-
-            # Add current query
-            messages.append({"role": "user", "content": query})
-
-            response = client_openai.chat.completions.create(
-                model="gpt-4o-mini", messages=messages
+            query_embedding = await embedding_service.embed(canonical)
+            if not shared:
+                metrics.incr("rag.cache.bypassed")
+                return await generate_context_answer(
+                    query, query_embedding, session_id, retrieved, history=True
+                )
+            return await answer_cache.get_or_compute(
+                canonical,
+                query_embedding,
+                lambda: generate_context_answer(
+                    query, query_embedding, session_id, retrieved
+                ),
             )
+            
+        except Exception as e:
+            logger.error(f"Get Additional Context failed::Try {tries}::Error: {str(e)}")
+            if tries < RAG_MAX_RETRIES:
+                # Yield to the event loop while backing off
+                await asyncio.sleep(RAG_RETRY_BACKOFF * 2**tries)
+        tries += 1
 
-            logger.info(f"OpenAI response: {response}")
-            assistant_response = response.choices[0].message.content.strip()
+    return None
 
-            # Upload KB fetching summaries to history
-            # conversation_histories[session_id].append(
-            #     {"role": "assistant", "content": assistant_response}
-            # )
-            # print("Adding response into conversation history when calling RAG")
 
-            return assistant_response
-            
+async def generate_context_answer(
+    query, query_embedding, session_id, retrieved=None, history=False
+):
+    # Retrieve contexts from the Qdrant vector database
+    search_result = await retrieve_for_query(query, query_embedding, session_id)
+    if retrieved is not None:
+        retrieved.append(search_result)
+    logger.info(f"Qdrant context retrieved: {[hit.id for hit in search_result]}")
+
+    messages = build_context_messages(query, search_result, session_id, history)
+    response = await client_openai.chat.completions.create(
+        model="gpt-4o-mini", messages=messages
+    )
+
+    logger.info(f"OpenAI response: {response}")
+    assistant_response = response.choices[0].message.content.strip()
+
+    # Upload KB fetching summaries to history
+    # conversation_histories[session_id].append(
+    #     {"role": "assistant", "content": assistant_response}
+    # )
+    # print("Adding response into conversation history when calling RAG")
+
+    return assistant_response
+
+
+async def stream_additional_context(query, api_key, session_id):
+    """Streaming variant of get_additional_context, yielding text deltas as they arrive."""
+    client_openai.api_key = api_key
+    canonical = retrieval_query(query)
+    words = caller_words(query)
+    shared = words is not None
+    query = words or query
+    retrieved = []
+    deltas = asyncio.Queue()
+
+    async def produce():
+        try:
+            async for delta in stream_with_retries(
+                query, canonical, session_id, retrieved, shared
+            ):
+                deltas.put_nowait(delta)
+        finally:
+            deltas.put_nowait(None)
+
+    task = asyncio.create_task(produce())
+    try:
+        # Once the first delta is in, the rest streams at the model's pace
+        try:
+            delta = await asyncio.wait_for(deltas.get(), RAG_DEADLINE)
+        except asyncio.TimeoutError:
+            yield deadline_answer(canonical, retrieved, "fallback")
+            return
+        if delta is None:
+            yield deadline_answer(canonical, retrieved, "error")
+            return
+        metrics.incr("rag.deadline.on_time")
+        while delta is not None:
+            yield delta
+            delta = await deltas.get()
+    finally:
+        if not task.done():
+            finish_late(task)
+
+
+async def stream_with_retries(query, canonical, session_id, retrieved, shared=True):
+    """
+    Text deltas of the knowledge-base answer, none if every try failed.
+    Only `shared` answers go through the cache, the others use the history.
+    """
+    tries = 0
+    while tries <= RAG_MAX_RETRIES:
+        emitted = False
+        try:
+            logger.info(f"OpenAI API streaming query sent:: {query}")
+            query_embedding = await embedding_service.embed(canonical)
+            if shared:
+                cached = await answer_cache.get(query_embedding)
+                if cached is None:
+                    cached = await answer_cache.join_inflight(canonical)
+                if cached is not None:
+                    yield cached
+                    return
+                # Another lookup may have begun it while this one checked
+                pending = answer_cache.begin(canonical)
+                if pending is not None:
+                    yield await asyncio.shield(pending)
+                    return
+            else:
+                metrics.incr("rag.cache.bypassed")
+            try:
+                search_result = await retrieve_for_query(
+                    query, query_embedding, session_id
+                )
+                retrieved.append(search_result)
+                logger.info(
+                    f"Qdrant context retrieved: {[hit.id for hit in search_result]}"
+                )
+
+                messages = build_context_messages(
+                    query, search_result, session_id, history=not shared
+                )
+                stream = await client_openai.chat.completions.create(
+                    model="gpt-4o-mini", messages=messages, stream=True
+                )
+                parts = []
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        emitted = True
+                        parts.append(chunk.choices[0].delta.content)
+                        yield parts[-1]
+            except BaseException as e:
+                if shared:
+                    answer_cache.fail(canonical, e)
+                raise
+            if shared:
+                await answer_cache.complete(
+                    canonical, query_embedding, "".join(parts).strip()
+                )
+            return
+
         except Exception as e:
-            logger.error(f"Get Additional Context failed::Try {tries}::Error: {str(e)}")
-            time.sleep(2)  # Wait before retrying
+            logger.error(
+                f"Stream Additional Context failed::Try {tries}::Error: {str(e)}"
+            )
+            # Part of the answer may already be spoken, so never restart it
+            if emitted:
+                return
+            if tries < RAG_MAX_RETRIES:
+                await asyncio.sleep(RAG_RETRY_BACKOFF * 2**tries)
         tries += 1
 
-    return "Sorry, I didn't get your query."
+
+def get_conversation_memory(session_id):
+    return sessions.get_or_create(session_id).memory
+
+
+def format_turns(turns):
+    return "\n".join(
+        f"{'User' if msg['role'] == 'user' else 'Assistant'}: {msg['content']}"
+        for msg in turns
+        if msg["role"] in ["user", "assistant"]
+    )
+
+
+async def summarize_turns(previous_summary, turns):
+    """Fold `turns` into the running summary of a call, off the hot path."""
+    response = await client_openai.chat.completions.create(
+        model="gpt-4o-mini",
+        messages=[
+            {
+                "role": "system",
+                "content": "You keep a running summary of a phone call between a caller and an AI doctor. Reply with the updated summary only, in at most five sentences, keeping symptoms, conditions and advice given.",
+            },
+            {
+                "role": "user",
+                "content": f"Summary so far: {previous_summary or 'None'}\n\nNew turns:\n{format_turns(turns)}",
+            },
+        ],
+        max_tokens=250,
+    )
+    return response.choices[0].message.content.strip()
+
+
+def first_sentence(text, min_length=20):
+    """Return the first complete sentence of `text`, or None if it is not finished yet."""
+    for match in re.finditer(r"[.!?](\s|$)", text):
+        # Skip short fragments such as "Dr." or "e.g."
+        if match.end() >= min_length and match.group(1):
+            return text[: match.start() + 1].strip()
+    return None
 
 
 # def create_session(api_key, project_id, caller_number):
-def create_session(api_key, caller_number):
+async def create_session(api_key, caller_number, call_sid=None):
 
     client_openai.api_key = api_key
 
-    # Generate a unique session ID
-    session_id = CURR_SESSION_ID
-    logger.info(f"Session Created for caller {caller_number}: {session_id}")
+    # One session per Twilio call, so concurrent callers never share state
+    session = await sessions.create(session_id_for_call(call_sid), caller_number)
+    logger.info(f"Session Created for caller {caller_number}: {session.session_id}")
 
-    # Initialize conversation history for this session
-    conversation_histories[session_id] = [
-        {"role": "system", "content": "You are a helpful assistant."}
-    ]
-
-    return session_id
+    return session.session_id
 
 
-async def send_session_update(openai_ws, phone_number, introduction):
-    introduction = introduction.replace("+", " ")
+async def configure_realtime_session(openai_ws, timeout=10):
+    """Apply the settings shared by every call and wait for them to take."""
     session_update = {
         "type": "session.update",
         "session": {
             "turn_detection": {
                 "type": "server_vad",
                 "threshold": 0.6,
-                "prefix_padding_ms": 300,
-                "silence_duration_ms": 500,
+                "prefix_padding_ms": VAD_PREFIX_PADDING_MS,
+                "silence_duration_ms": VAD_SILENCE_DURATION_MS,
             },
             "input_audio_format": "g711_ulaw",
             "output_audio_format": "g711_ulaw",
             "voice": VOICE,
-            "instructions": SYSTEM_MESSAGE.format(
-                phone_number=phone_number, introduction=introduction
+            # Transcripts of the caller are what speculative retrieval runs on
+            "input_audio_transcription": (
+                {"model": "whisper-1"} if RAG_PREFETCH else None
             ),
             "modalities": ["text", "audio"],
             "temperature": 0.8,
@@ -580,9 +1216,51 @@ async def send_session_update(openai_ws, phone_number, introduction):
             ],
         },
     }
+    await openai_ws.send(json.dumps(session_update))
+
+    async def session_updated():
+        async for message in openai_ws:
+            event = loads(message)
+            if event["type"] == "session.updated":
+                return
+            if event["type"] == "error":
+                raise RuntimeError(f"Realtime session update failed: {event}")
+
+    await asyncio.wait_for(session_updated(), timeout)
+
+
+async def send_session_update(openai_ws, phone_number, introduction, spoken=False):
+    """
+    Give the configured session this call's instructions and start the
+    introduction. Realtime events apply in order, so nothing needs to wait.
+    When the introduction is `spoken` from cached audio, it is only added to
+    the conversation, as said by the assistant.
+    """
+    introduction = introduction.replace("+", " ")
+    session_update = {
+        "type": "session.update",
+        "session": {
+            "instructions": SYSTEM_MESSAGE.format(
+                phone_number=phone_number, introduction=introduction
+            ),
+        },
+    }
     logger.info("Sending session update: %s", json.dumps(session_update))
     await openai_ws.send(json.dumps(session_update))
-    time.sleep(1)
+    if spoken:
+        await openai_ws.send(
+            json.dumps(
+                {
+                    "type": "conversation.item.create",
+                    "item": {
+                        "type": "message",
+                        "role": "assistant",
+                        "content": [{"type": "text", "text": introduction}],
+                    },
+                }
+            )
+        )
+        return
     initial_response = {
         "type": "conversation.item.create",
         "item": {
@@ -602,17 +1280,22 @@ async def send_session_update(openai_ws, phone_number, introduction):
     )
 
 
-async def play_typing(websocket, stream_sid):
-    with open(mp3_file_path, "rb") as mp3_file:
-        mp3_data = mp3_file.read()
-        base64_audio = base64.b64encode(mp3_data).decode("utf-8")
+async def play_phrase(websocket, stream_sid, frames, stop, loop=False):
+    """Play `frames` at real-time pace, until the end or `stop` is set."""
+    template = TwilioMediaTemplate(stream_sid)
 
-    audio_delta = {
-        "event": "media",
-        "streamSid": stream_sid,
-        "media": {"payload": base64_audio},
-    }
-    await websocket.send_json(audio_delta)
+    async def send(payload):
+        await websocket.send_text(template.render(payload))
+
+    try:
+        await play_frames(send, frames, stop, loop=loop)
+    except Exception as e:
+        logger.error(f"Error playing audio: {e}")
+
+
+async def play_typing(websocket, stream_sid, stop):
+    """Loop the typing sound at real-time pace until `stop` is set."""
+    await play_phrase(websocket, stream_sid, TYPING_FRAMES, stop, loop=True)
 
 
 async def clear_buffer(websocket, openai_ws, stream_sid):
@@ -631,23 +1314,122 @@ async def clear_buffer(websocket, openai_ws, stream_sid):
 ##############################################################
 
 
-def get_embedding(text, model="text-embedding-3-small"):
-    text = text.replace("\n", " ")
-    return client_openai.embeddings.create(input=[text], model=model).data[0].embedding
+# Search indexes held in memory, loaded at startup off the event loop and
+# swapped for fresh ones whenever ingestion bumps the collection generation.
+# Until they are ready, lookups use Qdrant and vector search alone.
+local_index = None
+bm25_index = None
+index_generation = None
+SEARCH_INDEX_REFRESH = int(os.getenv("SEARCH_INDEX_REFRESH", 30))  # seconds
+
+
+def build_bm25(index):
+    return BM25Index.build(index.ids, [index.payloads[i] for i in range(len(index))])
+
+
+async def load_search_indexes(from_disk=True):
+    """
+    Load the indexes written at ingest time, or pull the collection from
+    Qdrant and build them, then swap them in.
+    """
+    global local_index, bm25_index
+    if from_disk and os.path.exists(os.path.join(LOCAL_INDEX_PATH, "vectors.npy")):
+        index = await asyncio.to_thread(LocalVectorIndex.load, LOCAL_INDEX_PATH)
+    else:
+        index = await LocalVectorIndex.from_qdrant(vectordb_client, COLLECTION_NAME)
+    lexical = None
+    if RAG_RETRIEVAL == "hybrid":
+        if from_disk and os.path.exists(os.path.join(BM25_INDEX_PATH, "postings.npz")):
+            lexical = await asyncio.to_thread(BM25Index.load, BM25_INDEX_PATH)
+        else:
+            lexical = await asyncio.to_thread(build_bm25, index)
+    local_index, bm25_index = index, lexical
+    logger.info(
+        f"Search indexes loaded: {len(index)} points"
+        f", {len(lexical) if lexical else 0} BM25 chunks"
+    )
+
+
+async def collection_generation():
+    try:
+        return await get_async_redis().get(generation_key(COLLECTION_NAME))
+    except Exception as e:
+        logger.error(f"Reading the collection generation failed: {e}")
+        return None
 
 
-def query_qdrant(query_text):
-    query_embedding = get_embedding(query_text)
-    search_result = vectordb_client.search(
-        collection_name="respiratory_disease_guide",
-        query_vector=query_embedding,
-        limit=5,
+async def keep_search_indexes_fresh():
+    global index_generation
+    loaded = False
+    while True:
+        try:
+            generation = await collection_generation()
+            if not loaded:
+                await load_search_indexes()
+                loaded = True
+            elif generation is not None and generation != index_generation:
+                # Files on this worker may predate the ingestion, so rebuild
+                # from the collection itself
+                await load_search_indexes(from_disk=False)
+            index_generation = generation
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            metrics.incr("search_index.errors")
+            logger.error(f"Loading search indexes failed: {e}")
+        await asyncio.sleep(SEARCH_INDEX_REFRESH)
+
+
+async def vector_search(query_embedding, limit):
+    backend = "local" if RAG_BACKEND == "local" and local_index is not None else "qdrant"
+    with metrics.timer(f"vector_search.{backend}"):
+        if backend == "local":
+            return local_index.search(query_embedding, limit=limit)
+        response = await vectordb_client.query_points(
+            collection_name=COLLECTION_NAME,
+            query=query_embedding.tolist(),
+            limit=limit,
+        )
+        return response.points
+
+
+async def search_knowledge_base(query_text, query_embedding=None):
+    """Most relevant chunks for `query_text`, best first, as scored hits."""
+    if query_embedding is None:
+        query_embedding = await embedding_service.embed(retrieval_query(query_text))
+    index = bm25_index
+    if RAG_RETRIEVAL != "hybrid" or index is None:
+        return await vector_search(query_embedding, RAG_CONTEXT_CHUNKS)
+
+    # Exact terms ("hemoptysis", drug names) are what dense search misses, so
+    # rank the lexical and vector candidates together
+    vector_hits = await vector_search(query_embedding, RAG_CANDIDATES)
+    with metrics.timer("lexical_search.bm25"):
+        # Without the tool's lead-in, whose words would match any chunk
+        lexical_hits = index.search(canonical_query(query_text), limit=RAG_CANDIDATES)
+    return reciprocal_rank_fusion(
+        [vector_hits, lexical_hits], limit=RAG_CONTEXT_CHUNKS
     )
+
+
+async def retrieve_for_query(query, query_embedding, session_id):
+    """Hits prefetched from the caller's transcript if they fit `query`, else a search."""
+    session = sessions.get(session_id)
+    if session is not None and session.prefetch is not None:
+        hits = await session.prefetch.take(query, query_embedding)
+        if hits is not None:
+            logger.info(f"Using prefetched context for session {session_id}")
+            return hits
+    return await search_knowledge_base(query, query_embedding)
+
+
+async def query_qdrant(query_text, query_embedding=None):
+    search_result = await search_knowledge_base(query_text, query_embedding)
     return [hit.payload["text"] for hit in search_result]
 
 
-def rag_system(user_query):
-    retrieved_contexts = query_qdrant(user_query)
+async def rag_system(user_query):
+    retrieved_contexts = await query_qdrant(user_query)
     context_text = "\n".join(retrieved_contexts)
 
     messages = [
@@ -660,7 +1442,7 @@ def rag_system(user_query):
     ]
 
     # Generate the response using ChatCompletion endpoint
-    response = client_openai.chat.completions.create(
+    response = await client_openai.chat.completions.create(
         model="gpt-4o-mini", messages=messages, max_tokens=200, temperature=0.7
     )
 
@@ -669,65 +1451,74 @@ def rag_system(user_query):
 
 async def generate_conversation_summary(session_id):
     """Generate a summary of the conversation for a given session."""
-    if (
-        session_id not in conversation_histories
-        or not conversation_histories[session_id]
-    ):
+    session = sessions.get(session_id)
+    if session is None or not session.memory:
         return None
 
-    try:
-        # Format the conversation for summarization
-        formatted_convo = "\n".join(
-            [
-                f"{'User' if msg['role'] == 'user' else 'Assistant'}: {msg['content']}"
-                for msg in conversation_histories[session_id]
-                if msg["role"] in ["user", "assistant"]
-            ]
-        )
-
-        # Use OpenAI to generate a summary
-        summary_prompt = f"""
-                            Please provide a concise summary of this conversation, highlighting:
-                            1. Main topics discussed
-                            2. Key questions asked
-                            3. Important information provided
+    # Both relay loops summarize at hang-up; the lock keeps them from
+    # interleaving on the same session
+    async with session.lock:
+        try:
+            # Most of the call is already in the rolling summary, so only the
+            # latest turns are left to read
+            memory = session.memory
+            await memory.flush()
+            formatted_convo = format_turns(memory)
+            if memory.summary:
+                formatted_convo = (
+                    f"Summary of the earlier conversation: {memory.summary}\n\n"
+                    f"{formatted_convo}"
+                )
+
+            # Use OpenAI to generate a summary
+            summary_prompt = f"""
+                                Please provide a concise summary of this conversation, highlighting:
+                                1. Main topics discussed
+                                2. Key questions asked
+                                3. Important information provided
+
+                                Conversation:
+                                {formatted_convo}
+                            """
+
+            summary_response = await client_openai.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=[
+                    {
+                        "role": "system",
+                        "content": "You are a helpful assistant tasked with summarizing conversations.",
+                    },
+                    {"role": "user", "content": summary_prompt},
+                ],
+            )
 
-                            Conversation:
-                            {formatted_convo}
-                        """
+            summary = summary_response.choices[0].message.content.strip()
 
-        summary_response = client_openai.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
+            # Store the summary (you can modify this to store in a database)
+            # Stored for every worker, since the frontend may reach any
+            await sessions.save_summary(
+                session_id,
                 {
-                    "role": "system",
-                    "content": "You are a helpful assistant tasked with summarizing conversations.",
+                    "summary": summary,
+                    "timestamp": datetime.now().isoformat(),
+                    "caller_number": session.caller_number,
+                    "earlier_summary": memory.summary,
+                    "full_conversation": await sessions.turns(session_id),
                 },
-                {"role": "user", "content": summary_prompt},
-            ],
-        )
-
-        summary = summary_response.choices[0].message.content.strip()
-
-        # Store the summary (you can modify this to store in a database)
-        conversation_summaries[session_id] = {
-            "summary": summary,
-            "timestamp": datetime.now().isoformat(),
-            "caller_number": session_caller_numbers.get(session_id, "Unknown"),
-            "full_conversation": conversation_histories[session_id],
-        }
+            )
 
-        return summary
-    except Exception as e:
-        logger.error(f"Error generating conversation summary: {e}")
-        return None
+            return summary
+        except Exception as e:
+            logger.error(f"Error generating conversation summary: {e}")
+            return None
 
 
 @app.get("/conversation-summary/{session_id}")
 async def get_conversation_summary(session_id: str):
     """API endpoint to retrieve conversation summary."""
-    if session_id in conversation_summaries:
-        return conversation_summaries[session_id]
+    record = await sessions.record(session_id)
+    if record is not None and record.get("summary") is not None:
+        return record["summary"]
     return {"error": "Session not found"}
 
 
@@ -738,13 +1529,24 @@ async def get_conversation_summary(session_id: str):
 ##############################################################
 
 
-@app.post("/api/get-session-id")
-async def generate_session():
-    try:
-        return JSONResponse(content={"sessionId": CURR_SESSION_ID})
-    except:
-        session_id = str(uuid.uuid4())
-        return JSONResponse(content={"sessionId": session_id})
+@app.api_route("/api/get-session-id", methods=["GET", "POST"])
+async def generate_session(phone_number: Optional[str] = None):
+    """Session of the latest call from `phone_number`."""
+    # Without a number this would hand out another caller's conversation
+    if not phone_number or not phone_number.strip():
+        return JSONResponse(
+            content={"error": "phone_number is required"}, status_code=400
+        )
+    record = await sessions.find(phone_number.strip())
+    if record is None:
+        return JSONResponse(content={"error": "Session not found"}, status_code=404)
+    return JSONResponse(
+        content={
+            "sessionId": record["session_id"],
+            "callerNumber": record["caller_number"],
+            "createdAt": datetime.fromtimestamp(record["created_at"]).isoformat(),
+        }
+    )
 
 
 @app.websocket("/stream/{session_id}")
@@ -775,6 +1577,12 @@ if stream_sid in active_connections:
 """
 
 
+@app.get("/metrics")
+async def get_metrics():
+    """Process-local counters and latency percentiles for this worker."""
+    return JSONResponse(content={**metrics.snapshot(), "query_keys": query_keys.stats()})
+
+
 @app.get("/test")
 async def test_endpoint():
     return JSONResponse(content={"message": "Hello from the backend!"})
@@ -9,6 +9,7 @@ from qdrant_client import QdrantClient
 from datetime import datetime
 from pathlib import Path
 import time
+from utils.embeddings import EmbeddingCache, EmbeddingService, default_store
 
 load_dotenv()
 
@@ -16,6 +17,8 @@ OPENAI_API_KEY = st.secrets["OPENAI_API_KEY"]
 QDRANT_URL = st.secrets["QDRANT_URL"]
 QDRANT_API_KEY = st.secrets["QDRANT_API_KEY"]
 PERSONAL_PHONE_NUMBER = st.secrets["PERSONAL_PHONE_NUMBER"]
+# Number the demo calls come from, used to find the call's session
+CALLER_PHONE_NUMBER = st.secrets.get("CALLER_PHONE_NUMBER")
 
 # Get the absolute path to the project root directory
 ROOT_DIR = Path(__file__).resolve().parents[2]
@@ -25,6 +28,7 @@ LOGO_PATH = str(ROOT_DIR / "src" / "utils" / "lambdai.png")
 client = OpenAI()
 client.api_key = OPENAI_API_KEY
 vectordb_client = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY)
+embedding_service = EmbeddingService(client, EmbeddingCache(default_store()))
 
 # END POINTS
 CALL_STATUS_ENDPOINT = "https://aide-app-8fddbaafae53.herokuapp.com/api/get-session-id"  # Dummy endpoint for call status
@@ -106,18 +110,13 @@ def rag_system(user_query):
 
 
 def query_qdrant(query_text):
-    query_embedding = get_embedding(query_text)
-    search_result = vectordb_client.search(
+    query_embedding = embedding_service.embed(query_text)
+    search_result = vectordb_client.query_points(
         collection_name="respiratory_disease_guide",
-        query_vector=query_embedding,
+        query=query_embedding.tolist(),
         limit=5,
     )
-    return [hit.payload["text"] for hit in search_result]
-
-
-def get_embedding(text, model="text-embedding-3-small"):
-    text = text.replace("\n", " ")
-    return client.embeddings.create(input=[text], model=model).data[0].embedding
+    return [hit.payload["text"] for hit in search_result.points]
 
 
 # Define the help button
@@ -204,10 +203,14 @@ def add_timestamp(message):
 
 
 def generate_summary():
+    if not CALLER_PHONE_NUMBER:
+        st.error("Set CALLER_PHONE_NUMBER to find the call's session.")
+        return None
     try:
         # Step 1: Fetch the session ID
         session_response = requests.post(
-            "https://aide-app-8fddbaafae53.herokuapp.com/api/get-session-id"
+            "https://aide-app-8fddbaafae53.herokuapp.com/api/get-session-id",
+            params={"phone_number": CALLER_PHONE_NUMBER},
         )
         if session_response.status_code == 200:
             session_id = session_response.json().get("sessionId")
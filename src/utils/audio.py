@@ -0,0 +1,143 @@
+import asyncio
+import base64
+import struct
+import time
+
+import numpy as np
+
+# Twilio media streams carry 8 kHz mono G.711 μ-law, 1 byte per sample
+SAMPLE_RATE = 8000
+FRAME_MS = 20
+FRAME_BYTES = SAMPLE_RATE * FRAME_MS // 1000
+ULAW_SILENCE = 0xFF
+# Frames sent ahead of real time, absorbing network jitter
+LEAD_FRAMES = 3
+
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_MULAW = 7
+
+
+def read_wav(path):
+    """
+    (format tag, channels, sample rate, bits per sample, data) of a WAV file.
+    Parsed by hand since the wave module only reads PCM.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        raise ValueError(f"{path} is not a WAV file")
+    fmt, samples, offset = None, None, 12
+    while offset + 8 <= len(data):
+        chunk_id = data[offset : offset + 4]
+        (size,) = struct.unpack_from("<I", data, offset + 4)
+        body = data[offset + 8 : offset + 8 + size]
+        if chunk_id == b"fmt ":
+            tag, channels, rate, _, _, bits = struct.unpack_from("<HHIIHH", body)
+            fmt = (tag, channels, rate, bits)
+        elif chunk_id == b"data":
+            samples = body
+        offset += 8 + size + (size & 1)
+    if fmt is None or samples is None:
+        raise ValueError(f"{path} has no fmt or data chunk")
+    return (*fmt, samples)
+
+
+def write_ulaw_wav(path, audio):
+    """Write 8 kHz mono μ-law bytes as a WAV file, readable by `read_wav`."""
+    fmt = struct.pack(
+        "<HHIIHHH", WAVE_FORMAT_MULAW, 1, SAMPLE_RATE, SAMPLE_RATE, 1, 8, 0
+    )
+    body = (
+        b"WAVE"
+        + b"fmt "
+        + struct.pack("<I", len(fmt))
+        + fmt
+        + b"data"
+        + struct.pack("<I", len(audio))
+        + audio
+        + b"\0" * (len(audio) & 1)
+    )
+    with open(path, "wb") as f:
+        f.write(b"RIFF" + struct.pack("<I", len(body)) + body)
+
+
+def pcm16_to_ulaw(pcm):
+    """G.711 μ-law encoding of int16 samples."""
+    pcm = np.asarray(pcm, dtype=np.int32) >> 2  # 14-bit, rounded towards -inf
+    sign = np.where(pcm < 0, 0x00, 0x80)
+    magnitude = np.minimum(np.abs(pcm), 8158) + 0x21
+    exponent = np.floor(np.log2(magnitude)).astype(np.int32) - 5
+    mantissa = (magnitude >> (exponent + 1)) & 0x0F
+    return ((sign | (exponent << 4) | mantissa) ^ 0x7F).astype(np.uint8)
+
+
+def _ulaw_table():
+    codes = ~np.arange(256, dtype=np.int32) & 0xFF
+    exponent = (codes >> 4) & 0x07
+    magnitude = (((codes & 0x0F) << 3) + 0x84) << exponent
+    return np.where(codes & 0x80, 0x84 - magnitude, magnitude - 0x84).astype(np.int16)
+
+
+# Linear value of every μ-law byte, so decoding is one vectorized lookup
+ULAW_TO_PCM16 = _ulaw_table()
+
+
+def ulaw_to_pcm16(audio):
+    return ULAW_TO_PCM16[np.frombuffer(audio, dtype=np.uint8)]
+
+
+def resample(samples, rate, target_rate=SAMPLE_RATE):
+    """Linear-interpolation resampling, enough for comfort sounds."""
+    if rate == target_rate:
+        return samples
+    duration = len(samples) / rate
+    positions = np.arange(int(duration * target_rate)) * rate / target_rate
+    return np.interp(positions, np.arange(len(samples)), samples)
+
+
+def load_ulaw(path):
+    """Samples of a WAV file as 8 kHz mono μ-law bytes."""
+    tag, channels, rate, bits, data = read_wav(path)
+    if tag == WAVE_FORMAT_MULAW and channels == 1 and rate == SAMPLE_RATE:
+        return data
+    if tag != WAVE_FORMAT_PCM or bits != 16:
+        raise ValueError(f"{path}: only 16-bit PCM or 8 kHz mono μ-law is supported")
+    pcm = np.frombuffer(data, dtype="<i2").reshape(-1, channels).mean(axis=1)
+    return pcm16_to_ulaw(resample(pcm, rate)).tobytes()
+
+
+def payload_bytes(payload):
+    """Size of the audio in a base64 payload, without decoding it."""
+    return len(payload) * 3 // 4 - payload[-2:].count("=")
+
+
+def ulaw_frames(audio):
+    """Base64 payloads of `audio` cut into 20 ms frames, ready for Twilio."""
+    if len(audio) % FRAME_BYTES:
+        audio += bytes([ULAW_SILENCE]) * (FRAME_BYTES - len(audio) % FRAME_BYTES)
+    return [
+        base64.b64encode(audio[start : start + FRAME_BYTES]).decode("ascii")
+        for start in range(0, len(audio), FRAME_BYTES)
+    ]
+
+
+async def play_frames(send, frames, stop, loop=True, lead=LEAD_FRAMES):
+    """
+    Await `send(payload)` for each frame at real-time pace, starting over at
+    the end when `loop` is true, until `stop` (an asyncio.Event) is set.
+    Only `lead` frames are ever queued ahead of playback, so stopping leaves
+    at most that much audio to clear. Returns the number of frames sent.
+    """
+    frame_seconds = FRAME_MS / 1000
+    started = time.monotonic()
+    sent = 0
+    while not stop.is_set() and frames and (loop or sent < len(frames)):
+        await send(frames[sent % len(frames)])
+        sent += 1
+        delay = started + (sent - lead) * frame_seconds - time.monotonic()
+        if delay > 0:
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+    return sent
@@ -0,0 +1,313 @@
+"""
+Fast path for relaying audio frames between Twilio media streams and the
+OpenAI Realtime API without parsing or re-encoding them.
+
+Benchmark CPU time per frame against the plain json path, and of inbound
+batching (from the repository root):
+    python -m src.utils.audio_relay --frames 20000 --batch-ms 80
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import time
+
+import orjson
+
+from .audio import FRAME_BYTES, SAMPLE_RATE, payload_bytes
+from .metrics import metrics
+
+INBOUND_AUDIO_BATCH_MS = int(os.getenv("INBOUND_AUDIO_BATCH_MS", 80))
+INBOUND_AUDIO_MAX_DELAY_MS = int(os.getenv("INBOUND_AUDIO_MAX_DELAY_MS", 100))
+
+# Full parse of every non-audio message
+loads = orjson.loads
+
+_TWILIO_MEDIA = '"event":"media"'
+_TWILIO_PAYLOAD = '"payload":"'
+_OPENAI_AUDIO_DELTA = '"type":"response.audio.delta"'
+_OPENAI_DELTA = '"delta":"'
+_OPENAI_ITEM_ID = '"item_id":"'
+# How far into a message its event type is looked for
+_HEAD = 48
+
+
+def _string_after(message, marker):
+    """
+    The JSON string value following `marker`, or None if it is missing or
+    holds escapes (base64 never does, so those are left to the full parse).
+    """
+    start = message.find(marker)
+    if start < 0:
+        return None
+    start += len(marker)
+    end = message.find('"', start)
+    if end < 0 or message.find("\\", start, end) >= 0:
+        return None
+    return message[start:end]
+
+
+def twilio_media_payload(message):
+    """Base64 audio of a Twilio `media` message, or None for other events."""
+    if _TWILIO_MEDIA not in message[:_HEAD]:
+        return None
+    return _string_after(message, _TWILIO_PAYLOAD)
+
+
+def openai_audio_delta(message):
+    """Base64 audio of a `response.audio.delta` event, or None for other events."""
+    if _OPENAI_AUDIO_DELTA not in message[:_HEAD]:
+        return None
+    return _string_after(message, _OPENAI_DELTA)
+
+
+def openai_item_id(message):
+    """ID of the conversation item a Realtime API event belongs to, if any."""
+    return _string_after(message, _OPENAI_ITEM_ID)
+
+
+def input_audio_append(payload):
+    """`input_audio_buffer.append` event carrying `payload` as is."""
+    return '{"type":"input_audio_buffer.append","audio":"' + payload + '"}'
+
+
+class TwilioMediaTemplate:
+    """Twilio `media` messages of one stream, serialized around the payload."""
+
+    def __init__(self, stream_sid):
+        self.stream_sid = stream_sid
+        self.prefix = (
+            '{"event":"media","streamSid":'
+            + orjson.dumps(stream_sid).decode("utf-8")
+            + ',"media":{"payload":"'
+        )
+
+    def render(self, payload):
+        return self.prefix + payload + '"}}'
+
+    def mark(self, name):
+        """`mark` message, echoed back by Twilio once the audio before it played."""
+        return orjson.dumps(
+            {"event": "mark", "streamSid": self.stream_sid, "mark": {"name": name}}
+        ).decode("utf-8")
+
+
+class PlaybackTracker:
+    """
+    How much of the current response item the caller has heard. A mark
+    named `{item_id}:{ms}` follows each audio chunk relayed to Twilio,
+    which echoes it back when playback gets there; between marks playback
+    is assumed to go on in real time. Marks of an interrupted item, which
+    Twilio echoes back when its buffer is cleared, are ignored.
+    """
+
+    def __init__(self):
+        self.item_id = None
+        self.sent_ms = 0.0
+        self.played_ms = 0.0
+        self._played_at = None
+
+    def sent(self, item_id, payload):
+        """Name of the mark to send after `payload` of `item_id`."""
+        if item_id != self.item_id:
+            self.item_id = item_id
+            self.sent_ms = self.played_ms = 0.0
+            self._played_at = None
+        self.sent_ms += payload_bytes(payload) * 1000 / SAMPLE_RATE
+        return f"{item_id}:{self.sent_ms:.0f}"
+
+    def played(self, name):
+        item_id, _, ms = name.rpartition(":")
+        if item_id != self.item_id or not ms.isdigit():
+            return
+        self.played_ms = max(self.played_ms, float(ms))
+        self._played_at = time.monotonic()
+
+    def heard_ms(self):
+        if self._played_at is None:
+            return 0
+        elapsed = (time.monotonic() - self._played_at) * 1000
+        return int(min(self.played_ms + elapsed, self.sent_ms))
+
+    def interrupt(self):
+        """
+        (item_id, audio_end_ms) to truncate the current item at, or None if
+        the caller heard all of it. Stops tracking the item either way.
+        """
+        if self.item_id is None:
+            return None
+        item_id, heard, sent_ms = self.item_id, self.heard_ms(), self.sent_ms
+        self.item_id = None
+        if heard >= int(sent_ms):
+            return None
+        metrics.incr("playback.truncated")
+        metrics.observe("playback.unheard", (sent_ms - heard) / 1000)
+        return item_id, heard
+
+
+def conversation_item_truncate(item_id, audio_end_ms):
+    """Event dropping the audio of `item_id` past what the caller heard."""
+    return json.dumps(
+        {
+            "type": "conversation.item.truncate",
+            "item_id": item_id,
+            "content_index": 0,
+            "audio_end_ms": audio_end_ms,
+        }
+    )
+
+
+class InboundAudioBatcher:
+    """
+    Joins inbound 20 ms μ-law frames into `input_audio_buffer.append`
+    messages of `batch_ms`, awaiting `send(message)` for each. A partial
+    batch is sent once its first frame is `max_delay_ms` old; callers flush
+    right away on events that must not wait (stop, dtmf, barge-in). With
+    `batch_ms` of one frame or less, frames are passed through untouched.
+    """
+
+    def __init__(
+        self,
+        send,
+        batch_ms=INBOUND_AUDIO_BATCH_MS,
+        max_delay_ms=INBOUND_AUDIO_MAX_DELAY_MS,
+    ):
+        self.send = send
+        self.batch_bytes = SAMPLE_RATE * batch_ms // 1000
+        self.max_delay = max_delay_ms / 1000
+        self._buffer = bytearray()
+        self._timer = None
+        self._flushing = set()
+        # Keeps batches in order when a timed flush and a full batch overlap
+        self._lock = asyncio.Lock()
+
+    async def add(self, payload):
+        metrics.incr("inbound_audio.frames")
+        if self.batch_bytes <= FRAME_BYTES:
+            metrics.incr("inbound_audio.messages")
+            await self.send(input_audio_append(payload))
+            return
+        self._buffer += base64.b64decode(payload)
+        if len(self._buffer) >= self.batch_bytes:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(
+                self.max_delay, self._flush_later
+            )
+
+    def _flush_later(self):
+        self._timer = None
+        task = asyncio.create_task(self.flush())
+        self._flushing.add(task)
+        task.add_done_callback(self._flushing.discard)
+
+    async def flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        async with self._lock:
+            if not self._buffer:
+                return
+            chunk = base64.b64encode(self._buffer).decode("ascii")
+            self._buffer.clear()
+            metrics.incr("inbound_audio.messages")
+            await self.send(input_audio_append(chunk))
+
+
+def benchmark(frames=20000, frame_ms=20):
+    """CPU time per frame of the old json path and the fast path, both ways."""
+    audio = base64.b64encode(os.urandom(8 * frame_ms)).decode("ascii")
+    stream_sid = "MZ" + "0" * 32
+    inbound = json.dumps(
+        {
+            "event": "media",
+            "sequenceNumber": "42",
+            "media": {
+                "track": "inbound",
+                "chunk": "41",
+                "timestamp": "820",
+                "payload": audio,
+            },
+            "streamSid": stream_sid,
+        },
+        separators=(",", ":"),
+    )
+    outbound = json.dumps(
+        {
+            "type": "response.audio.delta",
+            "event_id": "event_" + "a" * 22,
+            "response_id": "resp_" + "b" * 22,
+            "item_id": "item_" + "c" * 22,
+            "output_index": 0,
+            "content_index": 0,
+            "delta": audio,
+        },
+        separators=(",", ":"),
+    )
+
+    def json_path():
+        data = json.loads(inbound)
+        json.dumps(
+            {"type": "input_audio_buffer.append", "audio": data["media"]["payload"]}
+        )
+        response = json.loads(outbound)
+        payload = base64.b64encode(base64.b64decode(response["delta"])).decode("utf-8")
+        json.dumps(
+            {"event": "media", "streamSid": stream_sid, "media": {"payload": payload}}
+        )
+
+    template = TwilioMediaTemplate(stream_sid)
+
+    def fast_path():
+        input_audio_append(twilio_media_payload(inbound))
+        template.render(openai_audio_delta(outbound))
+
+    relayed = json.loads(template.render(openai_audio_delta(outbound)))
+    assert relayed["media"]["payload"] == audio
+    frames_per_second = 1000 / frame_ms
+    print(f"{frames} frames of {frame_ms} ms each way ({len(audio)} base64 chars)")
+    for name, relay in (("json", json_path), ("fast", fast_path)):
+        started = time.process_time()
+        for _ in range(frames):
+            relay()
+        per_frame = (time.process_time() - started) / frames
+        # One inbound and one outbound frame every frame_ms, per call
+        calls = 1 / (per_frame * frames_per_second)
+        print(
+            f"  {name}: {per_frame * 1e6:7.2f} µs CPU per frame pair,"
+            f" relay alone saturates one core at {calls:,.0f} calls"
+        )
+
+
+async def benchmark_batching(frames=20000, batch_ms=INBOUND_AUDIO_BATCH_MS):
+    """Messages sent and CPU time per inbound frame, with and without batching."""
+    payload = base64.b64encode(os.urandom(FRAME_BYTES)).decode("ascii")
+    print(f"{frames} inbound frames of 20 ms")
+    for name, ms in (("per frame", 20), (f"{batch_ms} ms batches", batch_ms)):
+        sent = []
+
+        async def send(message):
+            sent.append(len(message))
+
+        batcher = InboundAudioBatcher(send, ms, max_delay_ms=10_000)
+        started = time.process_time()
+        for _ in range(frames):
+            await batcher.add(payload)
+        await batcher.flush()
+        per_frame = (time.process_time() - started) / frames
+        print(
+            f"  {name:>14}: {len(sent) / (frames / 50):5.1f} messages/s per call,"
+            f" {per_frame * 1e6:5.2f} µs CPU per frame"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--frames", type=int, default=20000)
+    parser.add_argument("--frame-ms", type=int, default=20)
+    parser.add_argument("--batch-ms", type=int, default=INBOUND_AUDIO_BATCH_MS)
+    args = parser.parse_args()
+    benchmark(args.frames, args.frame_ms)
+    asyncio.run(benchmark_batching(args.frames, args.batch_ms))
@@ -0,0 +1,164 @@
+import json
+import os
+import re
+from collections import Counter
+
+import numpy as np
+
+from .local_index import Hit, PayloadStore
+
+BM25_INDEX_PATH = os.getenv("BM25_INDEX_PATH", ".cache/bm25_index")
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    """
+    a about after all also am an and any are as at be been before being but by
+    can could did do does doing for from had has have having he her his how i if
+    in into is it its just me more most my no not of on or our out please she
+    should so some such than that the their them then there these they this
+    those to too very was we were what when where which while who why will with
+    would you your
+    """.split()
+)
+
+
+def tokenize(text):
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    Okapi BM25 over the knowledge base chunks, held as a compressed sparse
+    inverted index: for term t, its postings are doc_ids/term_freqs in
+    [offsets[t], offsets[t + 1]). Scoring a query touches only the postings
+    of its terms.
+    """
+
+    def __init__(
+        self,
+        vocabulary,
+        offsets,
+        doc_ids,
+        term_freqs,
+        doc_lengths,
+        ids,
+        payloads,
+        k1=1.2,
+        b=0.75,
+    ):
+        self.vocabulary = vocabulary
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.term_freqs = term_freqs
+        self.doc_lengths = doc_lengths
+        self.ids = ids
+        self.payloads = payloads
+        self.k1 = k1
+        self.b = b
+
+        n_docs = len(doc_lengths)
+        doc_freqs = np.diff(offsets)
+        idf = np.log1p((n_docs - doc_freqs + 0.5) / (doc_freqs + 0.5))
+        self.idf = idf.astype(np.float32)
+        avg_length = doc_lengths.mean() if n_docs else 1.0
+        # Per-document part of the BM25 denominator, computed once
+        length_norm = k1 * (1 - b + b * doc_lengths / avg_length)
+        self.length_norm = length_norm.astype(np.float32)
+
+    @classmethod
+    def build(cls, ids, payloads, k1=1.2, b=0.75):
+        vocabulary, postings, doc_lengths = {}, [], []
+        for doc, payload in enumerate(payloads):
+            counts = Counter(tokenize(payload["text"]))
+            doc_lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                term_id = vocabulary.setdefault(term, len(vocabulary))
+                postings.append((term_id, doc, tf))
+
+        postings.sort()
+        terms = np.array([p[0] for p in postings], dtype=np.int64)
+        offsets = np.searchsorted(terms, np.arange(len(vocabulary) + 1))
+        return cls(
+            vocabulary,
+            offsets.astype(np.int64),
+            np.array([p[1] for p in postings], dtype=np.int32),
+            np.array([p[2] for p in postings], dtype=np.uint16),
+            np.array(doc_lengths, dtype=np.float32),
+            np.asarray(ids, dtype=np.int64),
+            PayloadStore.from_payloads(payloads),
+            k1,
+            b,
+        )
+
+    def save(self, path=BM25_INDEX_PATH):
+        os.makedirs(path, exist_ok=True)
+        np.savez(
+            os.path.join(path, "postings.npz"),
+            offsets=self.offsets,
+            doc_ids=self.doc_ids,
+            term_freqs=self.term_freqs,
+            doc_lengths=self.doc_lengths,
+            ids=self.ids,
+            payload_offsets=self.payloads.offsets,
+        )
+        with open(os.path.join(path, "vocabulary.json"), "w", encoding="utf-8") as f:
+            json.dump(self.vocabulary, f)
+        with open(os.path.join(path, "payloads.bin"), "wb") as f:
+            f.write(self.payloads.blob)
+
+    @classmethod
+    def load(cls, path=BM25_INDEX_PATH):
+        arrays = np.load(os.path.join(path, "postings.npz"))
+        with open(os.path.join(path, "vocabulary.json"), encoding="utf-8") as f:
+            vocabulary = json.load(f)
+        with open(os.path.join(path, "payloads.bin"), "rb") as f:
+            blob = f.read()
+        return cls(
+            vocabulary,
+            arrays["offsets"],
+            arrays["doc_ids"],
+            arrays["term_freqs"],
+            arrays["doc_lengths"],
+            arrays["ids"],
+            PayloadStore(blob, arrays["payload_offsets"]),
+        )
+
+    def __len__(self):
+        return len(self.ids)
+
+    def search(self, query, limit=5):
+        scores = np.zeros(len(self.doc_lengths), dtype=np.float32)
+        for term, query_tf in Counter(tokenize(query)).items():
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                continue
+            start, stop = self.offsets[term_id], self.offsets[term_id + 1]
+            docs = self.doc_ids[start:stop]
+            tf = self.term_freqs[start:stop].astype(np.float32)
+            # Each document appears once per term, so plain fancy-index add is safe
+            scores[docs] += (
+                query_tf * self.idf[term_id] * tf * (self.k1 + 1)
+                / (tf + self.length_norm[docs])
+            )
+
+        matched = np.flatnonzero(scores)
+        if len(matched) > limit:
+            matched = matched[np.argpartition(scores[matched], -limit)[-limit:]]
+        matched = matched[np.argsort(-scores[matched])]
+        return [
+            Hit(int(self.ids[i]), float(scores[i]), self.payloads[i]) for i in matched
+        ]
+
+
+def reciprocal_rank_fusion(result_lists, limit=5, k=60):
+    """
+    Merge ranked hit lists by summing 1 / (k + rank) per point ID, so points
+    ranked well by several retrievers rise to the top.
+    """
+    fused, hits = {}, {}
+    for results in result_lists:
+        for rank, hit in enumerate(results, start=1):
+            fused[hit.id] = fused.get(hit.id, 0.0) + 1.0 / (k + rank)
+            hits.setdefault(hit.id, hit)
+    ranked = sorted(fused, key=fused.get, reverse=True)[:limit]
+    return [Hit(i, fused[i], hits[i].payload) for i in ranked]
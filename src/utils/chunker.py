@@ -0,0 +1,223 @@
+import logging
+import os
+import re
+import threading
+import time
+
+import tiktoken
+
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", 300))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", 40))
+# Retrieved chunks end up in gpt-4o-mini prompts, so count with its tokenizer
+TOKENIZER_MODEL = "gpt-4o-mini"
+# Characters per token of English text, for the fallback count
+APPROXIMATE_TOKEN_CHARS = 4
+# Seconds between attempts to load the tokenizer after a failure
+TOKENIZER_RETRY_INTERVAL = 60
+
+HEADING_RE = re.compile(r"^#{1,6}\s+\S")
+PARAGRAPH_RE = re.compile(r"\n\s*\n")
+SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+logger = logging.getLogger(__name__)
+
+
+class ApproximateEncoding:
+    """
+    Stand-in for the tokenizer when it cannot be loaded: "tokens" are runs
+    of `APPROXIMATE_TOKEN_CHARS` characters, so counts and cuts stay close.
+    """
+
+    def encode(self, text, **kwargs):
+        step = APPROXIMATE_TOKEN_CHARS
+        return [text[i : i + step] for i in range(0, len(text), step)]
+
+    def decode(self, tokens):
+        return "".join(tokens)
+
+
+_encoding = None
+_failed_at = None
+_encoding_lock = threading.Lock()
+
+
+def get_encoding(exact=False):
+    """
+    The tokenizer of `TOKENIZER_MODEL`. tiktoken downloads its files on
+    first use (unless they are in TIKTOKEN_CACHE_DIR), so the server loads
+    it in a thread at startup. Offline, counts fall back to an estimate and
+    loading is tried again TOKENIZER_RETRY_INTERVAL seconds later; with
+    `exact`, for ingestion, the failure is raised instead.
+    """
+    global _encoding, _failed_at
+    if _encoding is not None:
+        return _encoding
+    with _encoding_lock:
+        retry_due = (
+            _failed_at is None
+            or time.monotonic() - _failed_at >= TOKENIZER_RETRY_INTERVAL
+        )
+        if _encoding is None and (exact or retry_due):
+            try:
+                _encoding = tiktoken.encoding_for_model(TOKENIZER_MODEL)
+            except Exception as e:
+                _failed_at = time.monotonic()
+                if exact:
+                    raise
+                logger.error(
+                    f"Tokenizer unavailable, approximating token counts: {e}"
+                )
+    return _encoding if _encoding is not None else ApproximateEncoding()
+
+
+def count_tokens(text):
+    return len(get_encoding().encode(text, disallowed_special=()))
+
+
+def iter_blocks(pages):
+    """
+    Yield (page, block) for every markdown heading and paragraph of
+    `pages`, a list of (page number, markdown) pairs. Headings are always
+    their own block, even without a blank line after them.
+    """
+    for page, text in pages:
+        for paragraph in PARAGRAPH_RE.split(text):
+            body = []
+            for line in paragraph.strip().splitlines():
+                if HEADING_RE.match(line):
+                    if body:
+                        yield page, "\n".join(body)
+                        body = []
+                    yield page, line.strip()
+                elif line.strip():
+                    body.append(line)
+            if body:
+                yield page, "\n".join(body)
+
+
+def split_oversized(text, max_tokens):
+    """Split a block longer than `max_tokens` on sentences, then on tokens."""
+    if count_tokens(text) <= max_tokens:
+        return [text]
+    pieces, current = [], ""
+    for sentence in SENTENCE_RE.split(text):
+        candidate = f"{current} {sentence}".strip()
+        if count_tokens(candidate) <= max_tokens:
+            current = candidate
+            continue
+        if current:
+            pieces.append(current)
+        if count_tokens(sentence) <= max_tokens:
+            current = sentence
+            continue
+        # A single sentence longer than a chunk: cut it on token boundaries
+        tokens = get_encoding().encode(sentence, disallowed_special=())
+        for start in range(0, len(tokens), max_tokens):
+            pieces.append(get_encoding().decode(tokens[start : start + max_tokens]))
+        current = ""
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def overlap_tail(texts, overlap_tokens):
+    """
+    The trailing sentences of `texts` (consecutive paragraphs), up to
+    `overlap_tokens` in all. A last sentence longer than that is cut to its
+    final `overlap_tokens` tokens instead.
+    """
+    paragraphs, used = [], 0
+    for text in reversed(texts):
+        sentences = []
+        for sentence in reversed(SENTENCE_RE.split(text)):
+            tokens = count_tokens(sentence)
+            if used + tokens > overlap_tokens:
+                if not used and overlap_tokens > 0:
+                    ids = get_encoding().encode(sentence, disallowed_special=())
+                    sentences.insert(0, get_encoding().decode(ids[-overlap_tokens:]))
+                if sentences:
+                    paragraphs.insert(0, " ".join(sentences))
+                return "\n\n".join(paragraphs).strip()
+            sentences.insert(0, sentence)
+            used += tokens
+        paragraphs.insert(0, " ".join(sentences))
+    return "\n\n".join(paragraphs).strip()
+
+
+def chunk_pages(
+    pages,
+    max_tokens=CHUNK_TOKENS,
+    overlap_tokens=CHUNK_OVERLAP_TOKENS,
+    min_tokens=None,
+):
+    """
+    Pack the markdown of `pages` into chunks of at most about `max_tokens`
+    tokens that only break between paragraphs (or sentences, for paragraphs
+    longer than a chunk).
+    - A heading starts a new chunk, unless the current one holds fewer than
+      `min_tokens` (default a third of `max_tokens`), in which case short
+      consecutive sections are kept together.
+    - Each chunk starts with its section heading, so it reads on its own,
+      and never ends with a heading: those open the next chunk instead.
+    - Up to `overlap_tokens` of trailing sentences are repeated at the start
+      of the next chunk of the same section, cut on tokens if one sentence
+      is longer than that.
+    Returns dicts with the chunk text and its first and last page.
+    """
+    if min_tokens is None:
+        min_tokens = max_tokens // 3
+    chunks = []
+    heading = None
+    window = []  # (page, text, tokens) of the chunk being built
+    size = 0
+    has_body = False
+
+    def emit():
+        parts = list(window)
+        # Headings of short sections merged in at the end, before their body
+        while parts and HEADING_RE.match(parts[-1][1]):
+            parts.pop()
+        chunks.append(
+            {
+                "text": "\n\n".join(text for _, text, _ in parts),
+                "page": parts[0][0],
+                "page_end": parts[-1][0],
+            }
+        )
+
+    for page, block in iter_blocks(pages):
+        if HEADING_RE.match(block):
+            heading = (page, block, count_tokens(block))
+            if has_body and size < min_tokens:
+                # Short section: let the next one share its chunk
+                window.append(heading)
+                size += heading[2]
+                continue
+            if has_body:
+                emit()
+            window, size, has_body = [heading], heading[2], False
+            continue
+
+        budget = max_tokens - (heading[2] if heading else 0)
+        for piece in split_oversized(block, max(budget, 1)):
+            tokens = count_tokens(piece)
+            if has_body and size + tokens > max_tokens:
+                emit()
+                body = []
+                for part in reversed(window):
+                    if part is heading:
+                        break
+                    body.insert(0, part)
+                window = [heading] if heading else []
+                tail = overlap_tail([text for _, text, _ in body], overlap_tokens)
+                if tail:
+                    window.append((body[-1][0], tail, count_tokens(tail)))
+                size = sum(part[2] for part in window)
+                has_body = False
+            window.append((page, piece, tokens))
+            size += tokens
+            has_body = True
+
+    if has_body:
+        emit()
+    return chunks
@@ -0,0 +1,81 @@
+import asyncio
+import logging
+import os
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+MEMORY_RECENT_TURNS = int(os.getenv("MEMORY_RECENT_TURNS", 8))
+# Summarize once this many turns have piled up beyond the recent ones
+MEMORY_SUMMARY_BATCH = int(os.getenv("MEMORY_SUMMARY_BATCH", 6))
+
+
+class ConversationMemory:
+    """
+    Bounded history of one call: the last `recent_turns` messages verbatim
+    and a rolling summary of everything older.
+
+    Once `summary_batch` turns beyond the recent ones have accumulated, the
+    summary is refreshed by a background task that awaits
+    `summarize(previous_summary, turns)`. The summarized turns stay in
+    memory until the new summary is in, so nothing is lost meanwhile, and
+    are dropped after. If summarizing keeps failing, the oldest turns are
+    dropped anyway so memory stays bounded.
+    """
+
+    def __init__(
+        self,
+        summarize,
+        recent_turns=MEMORY_RECENT_TURNS,
+        summary_batch=MEMORY_SUMMARY_BATCH,
+    ):
+        self.summarize = summarize
+        self.recent_turns = recent_turns
+        self.summary_batch = summary_batch
+        self.max_turns = recent_turns + 4 * summary_batch
+        self.turns = []
+        self.summary = ""
+        self._refresh = None
+        self._dropped = 0  # turns dropped by the hard cap, ever
+
+    def __len__(self):
+        return len(self.turns)
+
+    def __iter__(self):
+        return iter(self.turns)
+
+    def __repr__(self):
+        return f"ConversationMemory(summary={self.summary!r}, turns={self.turns!r})"
+
+    def append(self, message):
+        self.turns.append(message)
+        if len(self.turns) > self.max_turns:
+            self._dropped += len(self.turns) - self.max_turns
+            del self.turns[: len(self.turns) - self.max_turns]
+        if (
+            self._refresh is None
+            and len(self.turns) >= self.recent_turns + self.summary_batch
+        ):
+            self._refresh = asyncio.create_task(self._refresh_summary())
+
+    async def _refresh_summary(self):
+        older = self.turns[: len(self.turns) - self.recent_turns]
+        dropped = self._dropped
+        try:
+            with metrics.timer("conversation_memory.summarize"):
+                summary = await self.summarize(self.summary, older)
+        except Exception as e:
+            logger.error(f"Conversation summary refresh failed: {e}")
+            return
+        finally:
+            self._refresh = None
+        self.summary = summary
+        # Turns are only ever appended, so the summarized ones are still the
+        # oldest, minus any the hard cap dropped meanwhile
+        del self.turns[: max(len(older) - (self._dropped - dropped), 0)]
+
+    async def flush(self):
+        """Wait for a summary refresh in progress, if any."""
+        if self._refresh is not None:
+            await asyncio.shield(self._refresh)
@@ -0,0 +1,253 @@
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", ".cache/embeddings.sqlite3")
+# Redis is shared and bounded in memory, so query embeddings expire there
+EMBEDDING_CACHE_TTL = int(os.getenv("EMBEDDING_CACHE_TTL", 7 * 24 * 3600))  # seconds
+MAX_INPUTS_PER_REQUEST = 256
+
+
+def normalize_text(text):
+    """Whitespace-normalised text, which is what actually gets embedded."""
+    return " ".join(text.split())
+
+
+def embedding_key(text, model=EMBEDDING_MODEL):
+    """Content address of an embedding: a hash of the model and the normalised text."""
+    content = f"{model}\0{normalize_text(text)}".encode("utf-8")
+    return hashlib.sha256(content).hexdigest()
+
+
+def to_bytes(vector):
+    return np.asarray(vector, dtype=np.float32).tobytes()
+
+
+def from_bytes(raw):
+    return np.frombuffer(raw, dtype=np.float32)
+
+
+class SQLiteEmbeddingStore:
+    """Persistent embedding tier in a local SQLite file, for when Redis is absent."""
+
+    def __init__(self, path=EMBEDDING_CACHE_PATH):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get_many(self, keys):
+        if not keys:
+            return {}
+        found = {}
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                batch = keys[start : start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                    batch,
+                )
+                found.update((key, from_bytes(raw)) for key, raw in rows)
+        return found
+
+    def set_many(self, vectors):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, to_bytes(vector)) for key, vector in vectors.items()],
+            )
+            self._conn.commit()
+
+
+class RedisEmbeddingStore:
+    """
+    Persistent embedding tier shared by every worker through Redis, each
+    vector expiring `ttl` seconds after it is written.
+    """
+
+    def __init__(self, redis_client, prefix="embedding", ttl=EMBEDDING_CACHE_TTL):
+        self.redis = redis_client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def get_many(self, keys):
+        if not keys:
+            return {}
+        values = self.redis.mget([f"{self.prefix}:{key}" for key in keys])
+        return {key: from_bytes(raw) for key, raw in zip(keys, values) if raw}
+
+    def set_many(self, vectors):
+        pipe = self.redis.pipeline(transaction=False)
+        for key, vector in vectors.items():
+            pipe.set(f"{self.prefix}:{key}", to_bytes(vector), ex=self.ttl)
+        pipe.execute()
+
+
+def default_store():
+    """Redis when REDISCLOUD_URL is configured, otherwise a local SQLite file."""
+    redis_url = os.getenv("REDISCLOUD_URL")
+    if redis_url:
+        import redis
+
+        return RedisEmbeddingStore(redis.Redis.from_url(redis_url, ssl_cert_reqs=None))
+    return SQLiteEmbeddingStore()
+
+
+class EmbeddingCache:
+    """
+    Two-tier, content-addressed cache of float32 embedding vectors.
+    - An in-process LRU of at most `max_entries` vectors.
+    - An optional persistent `store` (Redis or SQLite) behind it.
+    Failures of the persistent tier are logged and treated as misses.
+    """
+
+    def __init__(self, store=None, max_entries=4096):
+        self.store = store
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+
+    def _remember(self, vectors):
+        with self._lock:
+            for key, vector in vectors.items():
+                self._memory[key] = vector
+                self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def get_memory(self, keys):
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[key] = self._memory[key]
+        return found
+
+    def get_store(self, keys):
+        if self.store is None or not keys:
+            return {}
+        try:
+            found = self.store.get_many(keys)
+        except Exception as e:
+            logger.error(f"Embedding store read failed: {e}")
+            return {}
+        self._remember(found)
+        return found
+
+    def put(self, vectors):
+        self._remember(vectors)
+        if self.store is None:
+            return
+        try:
+            self.store.set_many(vectors)
+        except Exception as e:
+            logger.error(f"Embedding store write failed: {e}")
+
+
+class _EmbeddingServiceBase:
+    def __init__(self, client, cache=None, model=EMBEDDING_MODEL):
+        self.client = client
+        self.cache = cache if cache is not None else EmbeddingCache()
+        self.model = model
+
+    def _plan(self, texts):
+        """Split `texts` into cached vectors and the unique texts still to embed."""
+        keys = [embedding_key(text, self.model) for text in texts]
+        found = self.cache.get_memory(keys)
+        missing = {
+            key: normalize_text(text)
+            for key, text in zip(keys, texts)
+            if key not in found
+        }
+        return keys, found, missing
+
+    def _record(self, keys, found_before, found_store):
+        hits = sum(1 for key in keys if key in found_before or key in found_store)
+        metrics.incr("embedding_cache.hit", hits)
+        metrics.incr("embedding_cache.miss", len(keys) - hits)
+
+    def _batches(self, missing):
+        items = list(missing.items())
+        for start in range(0, len(items), MAX_INPUTS_PER_REQUEST):
+            yield items[start : start + MAX_INPUTS_PER_REQUEST]
+
+    @staticmethod
+    def _vectors(batch, response):
+        return {
+            key: np.asarray(item.embedding, dtype=np.float32)
+            for (key, _), item in zip(batch, response.data)
+        }
+
+
+class EmbeddingService(_EmbeddingServiceBase):
+    """Cached embeddings with a synchronous OpenAI client (ingestion, Streamlit)."""
+
+    def embed_many(self, texts):
+        keys, found, missing = self._plan(texts)
+        stored = self.cache.get_store(list(missing))
+        self._record(keys, found, stored)
+        found.update(stored)
+        missing = {key: text for key, text in missing.items() if key not in stored}
+
+        for batch in self._batches(missing):
+            response = self.client.embeddings.create(
+                input=[text for _, text in batch], model=self.model
+            )
+            vectors = self._vectors(batch, response)
+            self.cache.put(vectors)
+            found.update(vectors)
+        return [found[key] for key in keys]
+
+    def embed(self, text):
+        return self.embed_many([text])[0]
+
+
+class AsyncEmbeddingService(_EmbeddingServiceBase):
+    """
+    Cached embeddings with an asynchronous OpenAI client (the voice server).
+    The persistent tier is synchronous, so it is accessed from a worker thread
+    to keep the event loop free.
+    """
+
+    async def embed_many(self, texts):
+        keys, found, missing = self._plan(texts)
+        stored = {}
+        if missing:
+            stored = await asyncio.to_thread(self.cache.get_store, list(missing))
+        self._record(keys, found, stored)
+        found.update(stored)
+        missing = {key: text for key, text in missing.items() if key not in stored}
+
+        for batch in self._batches(missing):
+            response = await self.client.embeddings.create(
+                input=[text for _, text in batch], model=self.model
+            )
+            vectors = self._vectors(batch, response)
+            found.update(vectors)
+            if self.cache.store is None:
+                self.cache.put(vectors)
+            else:
+                await asyncio.to_thread(self.cache.put, vectors)
+        return [found[key] for key in keys]
+
+    async def embed(self, text):
+        return (await self.embed_many([text]))[0]
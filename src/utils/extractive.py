@@ -0,0 +1,46 @@
+"""
+Answers cut straight from a retrieved chunk, for when the LLM answer will
+not arrive in time.
+"""
+
+import math
+import re
+
+from .bm25 import tokenize
+
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def split_sentences(text):
+    return [s.strip() for s in SENTENCE_END.split(text.strip()) if s.strip()]
+
+
+def extractive_answer(query, text, max_sentences=2, max_words=60):
+    """
+    The `max_sentences` sentences of `text` sharing the most terms with
+    `query` (longer sentences weighed down), in their original order and
+    cut to `max_words`. Falls back to the opening sentences when none share
+    a term.
+    """
+    sentences = split_sentences(text)
+    if not sentences:
+        return ""
+    query_terms = set(tokenize(query))
+
+    def score(i):
+        terms = tokenize(sentences[i])
+        overlap = len(query_terms.intersection(terms))
+        return overlap / math.sqrt(len(terms) + 1)
+
+    scores = [score(i) for i in range(len(sentences))]
+    if not any(scores):
+        chosen = range(min(max_sentences, len(sentences)))
+    else:
+        ranked = sorted(range(len(sentences)), key=lambda i: (-scores[i], i))
+        chosen = sorted(i for i in ranked[:max_sentences] if scores[i] > 0)
+
+    words = " ".join(sentences[i] for i in chosen).split()
+    answer = " ".join(words[:max_words])
+    if len(words) > max_words:
+        answer = answer.rstrip(",;:") + "..."
+    return answer
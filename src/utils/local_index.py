@@ -0,0 +1,195 @@
+"""
+In-process alternative to searching the hosted Qdrant collection.
+
+Benchmark against Qdrant (from the repository root):
+    python -m src.utils.local_index --queries 200
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from .metrics import percentile
+
+LOCAL_INDEX_PATH = os.getenv("LOCAL_INDEX_PATH", ".cache/local_index")
+
+# Mirrors the fields of qdrant's ScoredPoint that callers use
+Hit = namedtuple("Hit", ["id", "score", "payload"])
+
+
+class PayloadStore:
+    """
+    Payloads packed into one contiguous UTF-8 JSON blob, indexed by an offsets
+    array, instead of one Python dict per point. Only the returned hits are
+    ever decoded.
+    """
+
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    @classmethod
+    def from_payloads(cls, payloads):
+        encoded = [json.dumps(p, ensure_ascii=False).encode("utf-8") for p in payloads]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(e) for e in encoded])
+        return cls(b"".join(encoded), offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return json.loads(self.blob[self.offsets[i] : self.offsets[i + 1]])
+
+
+class LocalVectorIndex:
+    """
+    Exact cosine search over a contiguous float32 matrix of unit vectors.
+    The matrix can be memory-mapped from the file written at ingest time, so
+    workers share the pages instead of each holding a copy.
+    """
+
+    def __init__(self, ids, vectors, payloads):
+        self.ids = ids
+        self.vectors = vectors
+        self.payloads = payloads
+
+    @classmethod
+    def build(cls, ids, vectors, payloads):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        return cls(
+            np.asarray(ids, dtype=np.int64),
+            np.ascontiguousarray(vectors / norms),
+            PayloadStore.from_payloads(payloads),
+        )
+
+    @classmethod
+    async def from_qdrant(cls, client, collection_name, batch_size=256):
+        """Pull every point of `collection_name` through an AsyncQdrantClient."""
+        ids, vectors, payloads = [], [], []
+        offset = None
+        while True:
+            points, offset = await client.scroll(
+                collection_name=collection_name,
+                limit=batch_size,
+                offset=offset,
+                with_payload=True,
+                with_vectors=True,
+            )
+            for point in points:
+                ids.append(point.id)
+                vectors.append(point.vector)
+                payloads.append(point.payload)
+            if offset is None:
+                break
+        # Stacking and normalizing the vectors is CPU-bound
+        return await asyncio.to_thread(cls.build, ids, vectors, payloads)
+
+    def save(self, path=LOCAL_INDEX_PATH):
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "vectors.npy"), self.vectors)
+        np.save(os.path.join(path, "ids.npy"), self.ids)
+        np.save(os.path.join(path, "offsets.npy"), self.payloads.offsets)
+        with open(os.path.join(path, "payloads.bin"), "wb") as f:
+            f.write(self.payloads.blob)
+
+    @classmethod
+    def load(cls, path=LOCAL_INDEX_PATH, mmap=True):
+        vectors = np.load(
+            os.path.join(path, "vectors.npy"), mmap_mode="r" if mmap else None
+        )
+        ids = np.load(os.path.join(path, "ids.npy"))
+        offsets = np.load(os.path.join(path, "offsets.npy"))
+        with open(os.path.join(path, "payloads.bin"), "rb") as f:
+            blob = f.read()
+        return cls(ids, vectors, PayloadStore(blob, offsets))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def update(self, removed_ids=(), ids=(), vectors=(), payloads=()):
+        """Copy of the index without `removed_ids` and with the given points added."""
+        keep = np.flatnonzero(~np.isin(self.ids, np.asarray(removed_ids, dtype=np.int64)))
+        new = LocalVectorIndex.build(ids, vectors, payloads) if len(ids) else None
+        return LocalVectorIndex(
+            np.concatenate([self.ids[keep]] + ([new.ids] if new else [])),
+            np.concatenate([self.vectors[keep]] + ([new.vectors] if new else [])),
+            PayloadStore.from_payloads(
+                [self.payloads[i] for i in keep] + (list(payloads) if new else [])
+            ),
+        )
+
+    def search(self, query_vector, limit=5):
+        query = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+        scores = self.vectors @ query
+        if limit < len(scores):
+            top = np.argpartition(scores, -limit)[-limit:]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+        return [
+            Hit(int(self.ids[i]), float(scores[i]), self.payloads[i]) for i in top
+        ]
+
+
+async def benchmark(collection_name, queries=200, limit=5, path=LOCAL_INDEX_PATH):
+    """Compare p50/p99 search latency of the local index and the Qdrant cluster."""
+    from qdrant_client import AsyncQdrantClient
+
+    client = AsyncQdrantClient(
+        url=os.getenv("QDRANT_URL"), api_key=os.getenv("QDRANT_API_KEY")
+    )
+    if os.path.exists(os.path.join(path, "vectors.npy")):
+        index = LocalVectorIndex.load(path)
+    else:
+        index = await LocalVectorIndex.from_qdrant(client, collection_name)
+
+    # Perturbed copies of stored vectors stand in for real query embeddings
+    rng = np.random.default_rng(0)
+    rows = rng.integers(0, len(index), size=queries)
+    noise = rng.normal(0, 0.01, (queries, index.vectors.shape[1]))
+    samples = (index.vectors[rows] + noise).astype(np.float32)
+
+    local, remote = [], []
+    for vector in samples:
+        start = time.perf_counter()
+        index.search(vector, limit)
+        local.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await client.query_points(
+            collection_name=collection_name,
+            query=vector.tolist(),
+            limit=limit,
+        )
+        remote.append(time.perf_counter() - start)
+
+    print(f"{len(index)} points, {queries} queries, top-{limit}")
+    for name, timings in (("local", local), ("qdrant", remote)):
+        print(
+            f"{name:>7}: p50 {percentile(timings, 50) * 1000:8.3f} ms"
+            f"  p99 {percentile(timings, 99) * 1000:8.3f} ms"
+        )
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--collection", default="respiratory_disease_guide")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=5)
+    parser.add_argument("--path", default=LOCAL_INDEX_PATH)
+    args = parser.parse_args()
+    asyncio.run(benchmark(args.collection, args.queries, args.limit, args.path))
@@ -0,0 +1,64 @@
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of numbers (0 <= pct <= 100)."""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+class Metrics:
+    """
+    Process-local counters and latency samples.
+    - Counters are plain integers, incremented with `incr`.
+    - Latencies keep the most recent `max_samples` observations (in seconds)
+      so p50/p99 reflect current behaviour rather than the whole uptime.
+    """
+
+    def __init__(self, max_samples=2048):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(int)
+        self._latencies = defaultdict(lambda: deque(maxlen=max_samples))
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self._counters[name] += value
+
+    def observe(self, name, seconds):
+        with self._lock:
+            self._latencies[name].append(seconds)
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def snapshot(self):
+        with self._lock:
+            counters = dict(self._counters)
+            latencies = {name: list(values) for name, values in self._latencies.items()}
+
+        return {
+            "counters": counters,
+            "latencies": {
+                name: {
+                    "count": len(values),
+                    "mean": sum(values) / len(values) if values else None,
+                    "p50": percentile(values, 50),
+                    "p99": percentile(values, 99),
+                }
+                for name, values in latencies.items()
+            },
+        }
+
+
+metrics = Metrics()
@@ -0,0 +1,105 @@
+"""
+Parallel markdown extraction of the knowledge base PDFs.
+
+Benchmark wall-clock scaling with worker count (from the repository root):
+    python -m src.utils.pdf_extract --workers 1 2 4
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pymupdf
+import pymupdf4llm
+
+# Documents longer than this are split into page ranges extracted in parallel
+PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", 16))
+
+
+def default_workers():
+    return os.cpu_count() or 1
+
+
+def page_ranges(pdf_path, pages_per_task=PAGES_PER_TASK):
+    with pymupdf.open(pdf_path) as doc:
+        page_count = doc.page_count
+    return [
+        (start, min(start + pages_per_task, page_count))
+        for start in range(0, page_count, pages_per_task)
+    ]
+
+
+def extract_pages(pdf_path, start, stop):
+    """Markdown of pages [start, stop) as (1-based page number, text) pairs."""
+    pages = pymupdf4llm.to_markdown(
+        pdf_path, pages=list(range(start, stop)), page_chunks=True, show_progress=False
+    )
+    return [(page["metadata"]["page_number"], page["text"]) for page in pages]
+
+
+def extract_documents(pdf_paths, workers=None, pages_per_task=PAGES_PER_TASK):
+    """
+    Yield (pdf_path, pages) for each document as soon as all of its page
+    ranges are extracted, so callers can chunk one document while the pool
+    keeps working on the rest. Only unfinished documents are held in memory.
+    """
+    if not pdf_paths:
+        return
+    workers = workers or default_workers()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures, remaining, parts = {}, {}, {}
+        for pdf_path in pdf_paths:
+            ranges = page_ranges(pdf_path, pages_per_task)
+            remaining[pdf_path] = len(ranges)
+            parts[pdf_path] = []
+            if not ranges:
+                continue
+            for start, stop in ranges:
+                future = pool.submit(extract_pages, pdf_path, start, stop)
+                futures[future] = pdf_path
+
+        for pdf_path in [p for p, count in remaining.items() if count == 0]:
+            del remaining[pdf_path]
+            yield pdf_path, parts.pop(pdf_path)
+
+        for future in as_completed(futures):
+            pdf_path = futures.pop(future)
+            parts[pdf_path].extend(future.result())
+            remaining[pdf_path] -= 1
+            if remaining[pdf_path] == 0:
+                del remaining[pdf_path]
+                yield pdf_path, sorted(parts.pop(pdf_path))
+
+
+def benchmark(pdf_paths, worker_counts, pages_per_task=PAGES_PER_TASK):
+    total_pages = sum(stop - start for p in pdf_paths for start, stop in page_ranges(p))
+    print(f"{len(pdf_paths)} PDFs, {total_pages} pages, {default_workers()} CPUs")
+    baseline = None
+    for workers in worker_counts:
+        started = time.perf_counter()
+        for _ in extract_documents(pdf_paths, workers, pages_per_task):
+            pass
+        elapsed = time.perf_counter() - started
+        baseline = baseline or elapsed
+        print(
+            f"  {workers:>2} workers: {elapsed:7.2f}s"
+            f"  {total_pages / elapsed:6.1f} pages/s  speedup x{baseline / elapsed:.2f}"
+        )
+
+
+if __name__ == "__main__":
+    import glob
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "pdfs",
+        nargs="*",
+        default=sorted(
+            glob.glob(os.path.join(os.path.dirname(__file__), "knowledge_base", "*.pdf"))
+        ),
+    )
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, default_workers()])
+    parser.add_argument("--pages-per-task", type=int, default=PAGES_PER_TASK)
+    args = parser.parse_args()
+    benchmark(args.pdfs, args.workers, args.pages_per_task)
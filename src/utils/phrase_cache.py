@@ -0,0 +1,115 @@
+"""
+Audio of fixed utterances, such as the introduction, captured from their
+first live generation and replayed on later calls without the model.
+"""
+
+import base64
+import difflib
+import hashlib
+import logging
+import os
+import re
+
+from .audio import load_ulaw, ulaw_frames, write_ulaw_wav
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+PHRASE_CACHE_PATH = os.getenv("PHRASE_CACHE_PATH", ".cache/phrase_audio")
+PHRASE_CACHE = os.getenv("PHRASE_CACHE", "true").lower() == "true"
+# How close the spoken transcript must be to the text for audio to be kept
+PHRASE_MIN_SIMILARITY = float(os.getenv("PHRASE_MIN_SIMILARITY", 0.9))
+
+
+def phrase_key(text, voice):
+    return hashlib.sha256(f"{voice}\n{text}".encode("utf-8")).hexdigest()[:32]
+
+
+def _words(text):
+    return re.findall(r"[a-z0-9']+", text.lower())
+
+
+def transcript_matches(text, transcript, min_similarity=PHRASE_MIN_SIMILARITY):
+    """Whether `transcript` says `text`, give or take punctuation and a word."""
+    if not transcript:
+        return False
+    ratio = difflib.SequenceMatcher(None, _words(text), _words(transcript)).ratio()
+    return ratio >= min_similarity
+
+
+class PhraseCache:
+    """
+    μ-law audio of phrases keyed by text and voice, one WAV file per phrase
+    under `path`, kept in memory as Twilio-ready frames once read.
+    """
+
+    def __init__(self, path=PHRASE_CACHE_PATH):
+        self.path = path
+        self._frames = {}
+
+    def _file(self, text, voice):
+        return os.path.join(self.path, f"{phrase_key(text, voice)}.wav")
+
+    def get(self, text, voice):
+        """Base64 20 ms frames of the phrase, or None if never captured."""
+        key = phrase_key(text, voice)
+        frames = self._frames.get(key)
+        if frames is None:
+            file = self._file(text, voice)
+            if not os.path.exists(file):
+                metrics.incr("phrase_cache.misses")
+                return None
+            try:
+                frames = ulaw_frames(load_ulaw(file))
+            except (OSError, ValueError) as e:
+                logger.error(f"Unreadable phrase audio {file}: {e}")
+                metrics.incr("phrase_cache.misses")
+                return None
+            self._frames[key] = frames
+        metrics.incr("phrase_cache.hits")
+        return frames
+
+    def put(self, text, voice, audio):
+        """Store μ-law `audio` of the phrase, replacing any earlier take."""
+        os.makedirs(self.path, exist_ok=True)
+        file = self._file(text, voice)
+        # Written aside and renamed, so other workers never read half a file
+        temp = f"{file}.{os.getpid()}.tmp"
+        write_ulaw_wav(temp, audio)
+        os.replace(temp, file)
+        self._frames[phrase_key(text, voice)] = ulaw_frames(audio)
+        logger.info(f"Cached {len(audio)} bytes of audio for phrase: {text}")
+
+
+class PhraseCapture:
+    """
+    Collects the audio deltas of the first response item after it starts,
+    to cache the phrase once the response completes with the expected words.
+    """
+
+    def __init__(self, text, voice):
+        self.text = text
+        self.voice = voice
+        self.item_id = None
+        self._audio = bytearray()
+
+    def add(self, item_id, payload):
+        if self.item_id is None:
+            self.item_id = item_id
+        if item_id == self.item_id:
+            self._audio += base64.b64decode(payload)
+
+    def result(self, response):
+        """Audio to cache from a `response.done` event, or None."""
+        if response.get("status") != "completed" or not self._audio:
+            return None
+        for item in response.get("output", []):
+            if item.get("id") != self.item_id:
+                continue
+            transcript = " ".join(
+                part.get("transcript") or "" for part in item.get("content", [])
+            )
+            if transcript_matches(self.text, transcript):
+                return bytes(self._audio)
+            logger.info(f"Not caching phrase, model said: {transcript}")
+        return None
@@ -0,0 +1,134 @@
+"""
+Speculative retrieval: search the knowledge base for what the caller just
+said while the Realtime model is still deciding to call the tool.
+"""
+
+import asyncio
+import logging
+import os
+import re
+import time
+
+import numpy as np
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+RAG_PREFETCH = os.getenv("RAG_PREFETCH", "false").lower() == "true"
+# Cosine similarity between the transcript and the tool query for reuse
+RAG_PREFETCH_SIMILARITY = float(os.getenv("RAG_PREFETCH_SIMILARITY", 0.8))
+RAG_PREFETCH_MAX_AGE = float(os.getenv("RAG_PREFETCH_MAX_AGE", 30))  # seconds
+
+
+def _retrieve(future):
+    # Failures of an abandoned prefetch are expected, not worth a warning
+    if not future.cancelled():
+        future.exception()
+
+
+def _words(text):
+    return re.findall(r"[a-z0-9']+", text.lower())
+
+
+def _contains(words, part):
+    """Whether the word list `part` appears, in order and unbroken, in `words`."""
+    n = len(part)
+    return any(words[i : i + n] == part for i in range(len(words) - n + 1))
+
+
+class RetrievalPrefetch:
+    """
+    The latest speculative search of one call. `start(transcript)` embeds
+    and searches in the background, cancelling the previous prefetch. At
+    tool-call time, `take(query, query_embedding)` hands over its hits if
+    the transcript's words are part of the query or close enough to it, and
+    cancels it otherwise. The caller speaking again cancels it too.
+    `outcome` says what the last `take` did: "hit", "miss" or None when
+    there was nothing to take.
+    """
+
+    def __init__(
+        self,
+        embed,
+        search,
+        min_similarity=RAG_PREFETCH_SIMILARITY,
+        max_age=RAG_PREFETCH_MAX_AGE,
+    ):
+        self.embed = embed
+        self.search = search
+        self.min_similarity = min_similarity
+        self.max_age = max_age
+        self.outcome = None
+        self._transcript = None
+        self._started = None
+        self._embedding = None
+        self._task = None
+
+    def start(self, transcript):
+        self.cancel()
+        transcript = transcript.strip()
+        if not _words(transcript):
+            return
+        self._transcript = transcript
+        self._started = time.monotonic()
+        self._embedding = asyncio.get_running_loop().create_future()
+        self._task = asyncio.create_task(self._run(transcript, self._embedding))
+        self._task.add_done_callback(_retrieve)
+        self._embedding.add_done_callback(_retrieve)
+        metrics.incr("prefetch.started")
+
+    async def _run(self, transcript, embedded):
+        try:
+            embedding = await self.embed(transcript)
+        except BaseException as e:
+            if not embedded.done():
+                embedded.set_exception(e)
+            raise
+        embedded.set_result(embedding)
+        return await self.search(transcript, embedding)
+
+    def cancel(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._embedding.cancel()
+        self._task = self._embedding = self._transcript = None
+
+    def _matches(self, transcript, query, query_embedding, embedding):
+        words = _words(transcript)
+        if not words:
+            return False
+        if _contains(_words(query), words):
+            return True
+        a = np.asarray(embedding, dtype=np.float32)
+        b = np.asarray(query_embedding, dtype=np.float32)
+        similarity = float(a @ b / (np.linalg.norm(a) * np.linalg.norm(b) or 1.0))
+        return similarity >= self.min_similarity
+
+    async def take(self, query, query_embedding):
+        """Prefetched hits for `query`, or None to search from scratch."""
+        task, embedded = self._task, self._embedding
+        started, transcript = self._started, self._transcript
+        self._task = self._embedding = self._transcript = None
+        self.outcome = None
+        if task is None:
+            return None
+        hits = None
+        try:
+            if time.monotonic() - started <= self.max_age:
+                embedding = await asyncio.shield(embedded)
+                if self._matches(transcript, query, query_embedding, embedding):
+                    hits = await task
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+        except Exception as e:
+            logger.error(f"Prefetch failed: {e}")
+        if hits is None:
+            task.cancel()
+            self.outcome = "miss"
+            metrics.incr("prefetch.misses")
+        else:
+            self.outcome = "hit"
+            metrics.incr("prefetch.hits")
+        return hits
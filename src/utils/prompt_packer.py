@@ -0,0 +1,124 @@
+import os
+
+from .chunker import count_tokens, get_encoding
+
+PROMPT_TOKEN_BUDGET = int(os.getenv("RAG_PROMPT_TOKENS", 1500))
+RECENT_TURNS = int(os.getenv("RAG_RECENT_TURNS", 4))  # kept verbatim
+OLD_TURN_TOKENS = 40  # older turns are cut to this many tokens
+MIN_CONTEXT_TOKENS = 50  # smaller context remainders are dropped, not cut
+# Fixed cost of a chat message (role and separators) on top of its content
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def truncate_tokens(text, max_tokens):
+    tokens = get_encoding().encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return get_encoding().decode(tokens[:max_tokens]).rstrip() + " ..."
+
+
+def message_tokens(message):
+    return count_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+
+def clean_history(history, query):
+    """
+    User and assistant turns of `history` with consecutive duplicates
+    removed, minus a trailing copy of `query` (the caller's question is
+    recorded in the history before the knowledge base is asked).
+    """
+    turns = []
+    for message in history:
+        if message.get("role") not in ("user", "assistant"):
+            continue
+        content = (message.get("content") or "").strip()
+        if not content or (turns and turns[-1] == (message["role"], content)):
+            continue
+        turns.append((message["role"], content))
+    if turns and turns[-1] == ("user", query.strip()):
+        turns.pop()
+    return [{"role": role, "content": content} for role, content in turns]
+
+
+def pack_messages(
+    persona,
+    query,
+    history,
+    contexts,
+    budget=PROMPT_TOKEN_BUDGET,
+    recent_turns=RECENT_TURNS,
+    summary=None,
+):
+    """
+    Chat messages for a knowledge base answer that fit in about `budget`
+    tokens. `contexts` are (text, score) pairs. Space is handed out in order:
+    - the persona, the query and the `summary` of earlier turns, always;
+    - the last `recent_turns` turns verbatim, up to a third of the budget;
+    - retrieved chunks from the highest score down, the last one cut to fit;
+    - older turns, newest first, each cut to OLD_TURN_TOKENS.
+    Returns (messages, stats) where stats holds the token and item counts.
+    """
+    turns = clean_history(history, query)
+    persona_message = {"role": "system", "content": persona}
+    query_message = {"role": "user", "content": query}
+    used = message_tokens(persona_message) + message_tokens(query_message)
+    summary_messages = []
+    if summary:
+        summary_messages.append(
+            {"role": "system", "content": f"Earlier in this call: {summary}"}
+        )
+        used += message_tokens(summary_messages[0])
+
+    recent, history_budget = [], budget // 3
+    for message in reversed(turns[-recent_turns:] if recent_turns else []):
+        cost = message_tokens(message)
+        if cost > history_budget:
+            break
+        recent.insert(0, message)
+        history_budget -= cost
+        used += cost
+
+    kept_contexts = []
+    remaining = budget - used - MESSAGE_OVERHEAD_TOKENS
+    for text, _ in sorted(contexts, key=lambda c: c[1], reverse=True):
+        cost = count_tokens(text) + 1  # joined with a newline
+        if cost > remaining:
+            if remaining >= MIN_CONTEXT_TOKENS:
+                kept_contexts.append(truncate_tokens(text, remaining - 2))
+                remaining = 0
+            break
+        kept_contexts.append(text)
+        remaining -= cost
+    context_message = {
+        "role": "system",
+        "content": "Retrieved Context: " + "\n".join(kept_contexts),
+    }
+    used += message_tokens(context_message)
+
+    older = []
+    for message in reversed(turns[: len(turns) - len(recent)]):
+        message = {
+            "role": message["role"],
+            "content": truncate_tokens(message["content"], OLD_TURN_TOKENS),
+        }
+        cost = message_tokens(message)
+        if used + cost > budget:
+            break
+        older.insert(0, message)
+        used += cost
+
+    messages = [
+        persona_message,
+        context_message,
+        *summary_messages,
+        *older,
+        *recent,
+        query_message,
+    ]
+    stats = {
+        "tokens": used,
+        "contexts": len(kept_contexts),
+        "turns": len(older) + len(recent),
+        "dropped_turns": len(turns) - len(older) - len(recent),
+    }
+    return messages, stats
@@ -0,0 +1,162 @@
+"""
+Pool of Realtime API connections opened and configured ahead of calls, so
+a call does not wait for the handshake and session setup before the
+introduction can start.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+REALTIME_POOL_SIZE = int(os.getenv("REALTIME_POOL_SIZE", 2))  # idle, per worker
+# Realtime sessions have a maximum duration, so idle connections are
+# replaced early enough to leave a full call's worth of it
+REALTIME_POOL_MAX_IDLE = int(os.getenv("REALTIME_POOL_MAX_IDLE", 120))  # seconds
+# A connection claimed by a webhook whose media stream never arrives
+REALTIME_CLAIM_TTL = int(os.getenv("REALTIME_CLAIM_TTL", 30))  # seconds
+MAINTAIN_INTERVAL = 5  # seconds
+
+
+class RealtimePool:
+    """
+    Keeps `size` idle connections, each opened with `connect()` and set up
+    with `configure(ws)` (the settings shared by every call).
+    - `claim(key)` reserves an idle connection for a call as soon as its
+      webhook arrives, without waiting.
+    - `connection(key)` hands the claimed connection to the media stream,
+      or any idle one, or opens a new one if the pool is empty, and closes
+      it when the call ends.
+    A background task replaces connections idle for over `max_idle`
+    seconds, drops closed ones and claims nobody took, and refills the pool.
+    """
+
+    def __init__(
+        self,
+        connect,
+        configure,
+        size=REALTIME_POOL_SIZE,
+        max_idle=REALTIME_POOL_MAX_IDLE,
+        claim_ttl=REALTIME_CLAIM_TTL,
+    ):
+        self.connect = connect
+        self.configure = configure
+        self.size = size
+        self.max_idle = max_idle
+        self.claim_ttl = claim_ttl
+        self._idle = []  # (ws, opened_at)
+        self._claimed = {}  # key -> (ws, claimed_at)
+        self._opening = 0
+        self._refilled = asyncio.Event()
+        self._task = None
+
+    def __len__(self):
+        return len(self._idle)
+
+    async def _open(self):
+        ws = await self.connect()
+        try:
+            await self.configure(ws)
+        except BaseException:
+            await ws.close()
+            raise
+        return ws
+
+    def _pop_idle(self):
+        while self._idle:
+            ws, opened_at = self._idle.pop(0)
+            if ws.open and time.monotonic() - opened_at < self.max_idle:
+                return ws
+            asyncio.create_task(ws.close())
+        return None
+
+    def claim(self, key):
+        """Reserve an idle connection for `key`. False if none is ready."""
+        ws = self._pop_idle()
+        self._refilled.set()
+        if ws is None:
+            return False
+        self._claimed[key] = (ws, time.monotonic())
+        return True
+
+    async def take(self, key):
+        ws = None
+        claimed = self._claimed.pop(key, None)
+        if claimed is not None and claimed[0].open:
+            ws = claimed[0]
+        if ws is None:
+            ws = self._pop_idle()
+        self._refilled.set()
+        if ws is not None:
+            metrics.incr("realtime_pool.hits")
+            return ws
+        metrics.incr("realtime_pool.misses")
+        return await self._open()
+
+    @asynccontextmanager
+    async def connection(self, key):
+        ws = await self.take(key)
+        try:
+            yield ws
+        finally:
+            await ws.close()
+
+    async def _fill(self):
+        while len(self._idle) + self._opening < self.size:
+            self._opening += 1
+            try:
+                with metrics.timer("realtime_pool.open"):
+                    ws = await self._open()
+                self._idle.append((ws, time.monotonic()))
+            finally:
+                self._opening -= 1
+
+    async def _expire(self):
+        now = time.monotonic()
+        keep = []
+        for ws, opened_at in self._idle:
+            if ws.open and now - opened_at < self.max_idle:
+                keep.append((ws, opened_at))
+            else:
+                await ws.close()
+        self._idle = keep
+        for key, (ws, claimed_at) in list(self._claimed.items()):
+            if not ws.open or now - claimed_at > self.claim_ttl:
+                del self._claimed[key]
+                await ws.close()
+
+    async def _maintain(self):
+        while True:
+            try:
+                await self._expire()
+                await self._fill()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                metrics.incr("realtime_pool.errors")
+                logger.error(f"Realtime pool refill failed: {e}")
+            self._refilled.clear()
+            try:
+                await asyncio.wait_for(self._refilled.wait(), MAINTAIN_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        if self.size > 0 and self._task is None:
+            self._task = asyncio.create_task(self._maintain())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for ws, _ in self._idle:
+            await ws.close()
+        for ws, _ in self._claimed.values():
+            await ws.close()
+        self._idle.clear()
+        self._claimed.clear()
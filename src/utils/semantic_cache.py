@@ -0,0 +1,428 @@
+import asyncio
+import hashlib
+import logging
+import re
+import struct
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from .bm25 import tokenize
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Header of a serialised entry: expiry timestamp and vector dimension
+_ENTRY_HEADER = struct.Struct("<dI")
+
+
+def normalize_query(text):
+    """Case- and whitespace-insensitive form of a query, used for exact matching."""
+    return " ".join(text.lower().split())
+
+
+# "A user asked: '<the caller's words>' ...", as SYSTEM_MESSAGE asks the
+# Realtime model to phrase knowledge base queries (the tool description also
+# asks for a "Please use your knowledge base" lead-in, so it may not be first)
+_EXPANDED_PREFIX = re.compile(r"\ba user asked\s*:\s*", re.IGNORECASE)
+_KNOWLEDGE_BASE_LEAD_IN = re.compile(
+    r"^\s*please use your knowledge base\b[\s.,:;-]*", re.IGNORECASE
+)
+# A quote opening the caller's words, with the character closing it
+_OPENING_QUOTES = {'"': '"', "“": "”", "[": "]", "'": "'"}
+# A single quote closes the span unless it is part of a word (won't) or
+# a plural possessive followed by its noun (kids' coughs)
+_SINGLE_CLOSE = re.compile(r"'(?!\w)(?<!s')|(?<=s)'(?![ \t]+[a-z])(?!\w)")
+_SENTENCE_END = re.compile(r"(?<=[.?!])\s+")
+# Sentences where the model stops quoting the caller and starts describing
+# them or the answer it wants ("They are concerned about TB.")
+_PARAPHRASE = re.compile(
+    r"^(?:please|they|their|he|she|his|the (?:user|caller|patient|person)|"
+    r"this (?:user|caller|patient|person)|provide|explain|include|consider|"
+    r"discuss|describe|additionally|also)\b",
+    re.IGNORECASE,
+)
+# Words that point back at an earlier turn ("Is it contagious?")
+_ANAPHORA = frozenset(
+    "it its it's this that these those they them their he she him her there"
+    " same such one ones".split()
+)
+# Fewer topic terms than this and the caller's words alone are ambiguous
+MIN_CANONICAL_TERMS = 2
+
+
+def _quoted(rest):
+    """The caller's words if `rest` opens with a quote, else None."""
+    opening = rest[:1]
+    if opening not in _OPENING_QUOTES:
+        return None
+    if opening != "'":
+        end = rest.find(_OPENING_QUOTES[opening], 1)
+        return rest[1:end] if end > 0 else None
+    closes = [m.start() for m in _SINGLE_CLOSE.finditer(rest, 1)]
+    if not closes:
+        # Only possessive-looking quotes: the last one closes the span
+        closes = [m.start() for m in re.finditer(r"'(?!\w)", rest[1:])]
+        closes = [closes[-1] + 1] if closes else []
+    return rest[1 : closes[0]] if closes else None
+
+
+def _unquoted(rest):
+    """The sentences of `rest` before the model's paraphrase of the caller."""
+    words = []
+    for sentence in _SENTENCE_END.split(rest):
+        if _PARAPHRASE.match(sentence):
+            break
+        words.append(sentence)
+    return " ".join(words)
+
+
+def is_self_contained(words):
+    """
+    Whether the caller's `words` name their topic without the expansion:
+    at least MIN_CANONICAL_TERMS terms, and none of their sentences refers
+    back to something before the topic is named ("Is it contagious?", but
+    not "I have a cough. Is it serious?").
+    """
+    terms = 0
+    for sentence in _SENTENCE_END.split(words.strip()):
+        words = set(re.findall(r"[a-z']+", sentence.lower()))
+        if terms < MIN_CANONICAL_TERMS and words & _ANAPHORA:
+            return False
+        terms += sum(1 for t in tokenize(sentence.replace("'", " ")) if len(t) > 1)
+    return terms >= MIN_CANONICAL_TERMS
+
+
+def caller_words(text):
+    """
+    The caller's own words from an expanded "A user asked: ..." query, or
+    None when there are none that stand on their own. Like the PDF report's
+    extract_text_in_quotes, but keeps the whole quote (a question often
+    follows a first statement) and accepts the other quoting styles the
+    model uses. Without a quote, keeps every sentence up to the model's
+    paraphrase. Words too short or referring back to earlier turns ("Is it
+    contagious?") need the expansion for their topic, so they are None.
+    """
+    match = _EXPANDED_PREFIX.search(text)
+    if not match:
+        return None
+    rest = text[match.end() :].strip()
+    words = _quoted(rest)
+    if words is None:
+        words = _unquoted(rest)
+    words = words.strip()
+    return words if is_self_contained(words) else None
+
+
+def strip_lead_in(text):
+    """`text` without the tool's "Please use your knowledge base ... A user asked:"."""
+    match = _EXPANDED_PREFIX.search(text)
+    if match:
+        return text[match.end() :]
+    return _KNOWLEDGE_BASE_LEAD_IN.sub("", text)
+
+
+def canonical_query(text):
+    """
+    Normalized form of a query for embedding, caching and lexical search:
+    the caller's own words when they stand on their own, else the whole
+    query past its boilerplate lead-in.
+    """
+    words = caller_words(text) or strip_lead_in(text)
+    return normalize_query(words).strip(" .?!,;:")
+
+
+class QueryKeyStats:
+    """
+    How many distinct expanded queries share a canonical cache key. A
+    collision is an expanded query seen for the first time whose canonical
+    form was already seen, i.e. a lookup the canonical key can serve that
+    the expanded one could not. Tracks at most `max_keys` canonical keys.
+    """
+
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        self._variants = OrderedDict()
+        self.queries = 0
+        self.distinct = 0
+        self.collisions = 0
+        self.chars_in = 0
+        self.chars_out = 0
+
+    def record(self, query, canonical):
+        self.queries += 1
+        self.chars_in += len(query)
+        self.chars_out += len(canonical)
+        key, variant = query_key(canonical), query_key(query)
+        variants = self._variants.get(key)
+        if variants is None:
+            variants = self._variants[key] = set()
+            while len(self._variants) > self.max_keys:
+                self._variants.popitem(last=False)
+        else:
+            self._variants.move_to_end(key)
+        if variant not in variants:
+            self.distinct += 1
+            if variants:
+                self.collisions += 1
+                metrics.incr("query_keys.collisions")
+            variants.add(variant)
+        metrics.incr("query_keys.queries")
+
+    def stats(self):
+        return {
+            "queries": self.queries,
+            "distinct_queries": self.distinct,
+            "canonical_keys": len(self._variants),
+            "collisions": self.collisions,
+            "collision_rate": self.collisions / self.distinct if self.distinct else 0.0,
+            "chars_per_query": self.chars_in / self.queries if self.queries else 0.0,
+            "canonical_chars_per_query": (
+                self.chars_out / self.queries if self.queries else 0.0
+            ),
+        }
+
+
+def query_key(text):
+    return hashlib.sha1(normalize_query(text).encode("utf-8")).hexdigest()
+
+
+def generation_key(collection_name):
+    """Redis key bumped every time `collection_name` is rebuilt."""
+    return f"{collection_name}:generation"
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class _Entry:
+    __slots__ = ("vector", "answer", "expires_at")
+
+    def __init__(self, vector, answer, expires_at):
+        self.vector = vector
+        self.answer = answer
+        self.expires_at = expires_at
+
+    def dumps(self):
+        return (
+            _ENTRY_HEADER.pack(self.expires_at, len(self.vector))
+            + self.vector.tobytes()
+            + self.answer.encode("utf-8")
+        )
+
+    @classmethod
+    def loads(cls, raw):
+        expires_at, dim = _ENTRY_HEADER.unpack_from(raw)
+        offset = _ENTRY_HEADER.size
+        vector = np.frombuffer(raw, dtype=np.float32, count=dim, offset=offset)
+        answer = raw[offset + dim * 4 :].decode("utf-8")
+        return cls(vector, answer, expires_at)
+
+
+class SemanticCache:
+    """
+    Answer cache keyed on query embeddings.
+    - A lookup hits when a cached query's embedding has cosine similarity of at
+      least `threshold` with the new one.
+    - Entries expire after `ttl` seconds; at most `max_entries` are kept
+      in-process, least recently used first out.
+    - With an asyncio Redis client (or a function returning one, to create
+      it on first use), entries are also written to a shared hash that
+      every worker pulls from (at most every `sync_interval` seconds), so
+      an answer computed on one worker serves the others.
+    - The Redis hash is namespaced by the collection's generation counter, so
+      rebuilding the collection invalidates every worker's cache.
+    - Identical concurrent queries are coalesced into one upstream request.
+    """
+
+    def __init__(
+        self,
+        collection_name,
+        threshold=0.95,
+        ttl=3600,
+        max_entries=1024,
+        redis_client=None,
+        sync_interval=2.0,
+    ):
+        self.collection_name = collection_name
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._redis = redis_client
+        self.sync_interval = sync_interval
+
+        self._entries = OrderedDict()
+        self._matrix = None  # stacked unit vectors, rebuilt lazily
+        self._keys = []
+        self._inflight = {}
+        self._generation = None
+        self._remote_seen = set()
+        self._last_sync = 0.0
+
+    @property
+    def redis(self):
+        return self._redis() if callable(self._redis) else self._redis
+
+    def _hash_name(self):
+        return f"semantic_cache:{self.collection_name}:{self._generation or 0}"
+
+    def clear(self):
+        self._entries.clear()
+        self._matrix = None
+        self._remote_seen.clear()
+
+    def _store(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        self._matrix = None
+
+    def _purge_expired(self, now):
+        expired = [k for k, e in self._entries.items() if e.expires_at <= now]
+        for key in expired:
+            del self._entries[key]
+        if expired:
+            self._matrix = None
+
+    def _search(self, vector):
+        if not self._entries:
+            return None
+        if self._matrix is None:
+            self._keys = list(self._entries)
+            self._matrix = np.stack([self._entries[k].vector for k in self._keys])
+        scores = self._matrix @ vector
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            return None
+        key = self._keys[best]
+        self._entries.move_to_end(key)
+        return self._entries[key].answer
+
+    async def _sync(self, force=False):
+        """Pull entries written by other workers and detect collection rebuilds."""
+        if self.redis is None:
+            return
+        now = time.time()
+        if not force and now - self._last_sync < self.sync_interval:
+            return
+        self._last_sync = now
+        try:
+            generation = await self.redis.get(generation_key(self.collection_name))
+            generation = int(generation) if generation else 0
+            if generation != self._generation:
+                if self._generation is not None:
+                    logger.info(
+                        f"Collection {self.collection_name} rebuilt, clearing semantic cache"
+                    )
+                    metrics.incr("semantic_cache.invalidations")
+                self._generation = generation
+                self.clear()
+
+            fields = await self.redis.hkeys(self._hash_name())
+            missing = [f for f in fields if f not in self._remote_seen]
+            if not missing:
+                return
+            values = await self.redis.hmget(self._hash_name(), missing)
+            for field, raw in zip(missing, values):
+                self._remote_seen.add(field)
+                if raw is None:
+                    continue
+                entry = _Entry.loads(raw)
+                if entry.expires_at > now:
+                    key = field.decode() if isinstance(field, bytes) else field
+                    self._store(key, entry)
+        except Exception as e:
+            logger.error(f"Semantic cache sync failed: {e}")
+
+    async def get(self, embedding):
+        with metrics.timer("semantic_cache.lookup"):
+            await self._sync()
+            self._purge_expired(time.time())
+            answer = self._search(_unit(embedding))
+        metrics.incr("semantic_cache.hit" if answer is not None else "semantic_cache.miss")
+        return answer
+
+    async def set(self, query, embedding, answer):
+        key = query_key(query)
+        entry = _Entry(_unit(embedding), answer, time.time() + self.ttl)
+        self._store(key, entry)
+        if self.redis is None:
+            return
+        try:
+            self._remote_seen.add(key.encode())
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.hset(self._hash_name(), key, entry.dumps())
+                pipe.expire(self._hash_name(), self.ttl)
+                await pipe.execute()
+        except Exception as e:
+            logger.error(f"Semantic cache write failed: {e}")
+
+    async def join_inflight(self, query):
+        """Await the answer of an identical query already being computed, if any."""
+        future = self._inflight.get(query_key(query))
+        if future is None:
+            return None
+        metrics.incr("semantic_cache.coalesced")
+        return await asyncio.shield(future)
+
+    def begin(self, query):
+        """
+        Mark `query` as being computed so identical queries wait for it.
+        Returns None when the caller is to compute it, or the pending answer
+        of a caller that began it first, to await instead.
+        """
+        key = query_key(query)
+        pending = self._inflight.get(key)
+        if pending is not None and not pending.done():
+            metrics.incr("semantic_cache.coalesced")
+            return pending
+        self._inflight[key] = asyncio.get_running_loop().create_future()
+        return None
+
+    async def complete(self, query, embedding, answer):
+        future = self._inflight.pop(query_key(query), None)
+        if future is not None and not future.done():
+            future.set_result(answer)
+        await self.set(query, embedding, answer)
+
+    def fail(self, query, error):
+        future = self._inflight.pop(query_key(query), None)
+        if future is None or future.done():
+            return
+        if not isinstance(error, Exception):
+            # Cancellation of the leader must not cancel its followers
+            error = RuntimeError("Upstream request was cancelled")
+        future.set_exception(error)
+        # Followers may not exist; don't warn about an unretrieved exception
+        future.exception()
+
+    async def get_or_compute(self, query, embedding, compute):
+        """
+        Return a cached answer for `query`, or await `compute()` once for all
+        concurrent callers asking the same thing and cache its result.
+        """
+        answer = await self.get(embedding)
+        if answer is None:
+            answer = await self.join_inflight(query)
+        if answer is not None:
+            return answer
+
+        pending = self.begin(query)
+        if pending is not None:
+            return await asyncio.shield(pending)
+        try:
+            with metrics.timer("semantic_cache.upstream"):
+                answer = await compute()
+        except BaseException as e:
+            self.fail(query, e)
+            raise
+        await self.complete(query, embedding, answer)
+        return answer
+
+    def stats(self):
+        return {"entries": len(self._entries), "inflight": len(self._inflight)}
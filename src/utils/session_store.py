@@ -0,0 +1,232 @@
+"""
+Session records shared by every worker: caller number, transfer flag,
+summaries and the turns of each call.
+
+Benchmark the per-turn write overhead (from the repository root):
+    python -m src.utils.session_store --backend memory fakeredis
+    python -m src.utils.session_store --backend redis   # uses REDISCLOUD_URL
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+
+from .metrics import percentile
+
+SESSION_TTL = int(os.getenv("SESSION_TTL", 24 * 3600))  # seconds
+SESSION_MAX_TURNS = int(os.getenv("SESSION_MAX_TURNS", 500))  # kept per call
+# Only read by the redirect right after the stream ends
+TRANSFER_TTL = int(os.getenv("TRANSFER_TTL", 600))  # seconds
+
+
+def _text(value):
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+
+class InMemorySessionStore:
+    """Process-local store, for a single worker and for local runs."""
+
+    def __init__(self, max_sessions=1000):
+        self.max_sessions = max_sessions
+        self._records = OrderedDict()
+        self._turns = {}
+        self._by_number = {}
+
+    async def create(self, session_id, caller_number, created_at):
+        self._records[session_id] = {
+            "caller_number": caller_number,
+            "created_at": created_at,
+            "transfer": False,
+        }
+        self._turns[session_id] = []
+        self._by_number[caller_number] = session_id
+        while len(self._records) > self.max_sessions:
+            evicted, record = self._records.popitem(last=False)
+            self._turns.pop(evicted, None)
+            if self._by_number.get(record["caller_number"]) == evicted:
+                del self._by_number[record["caller_number"]]
+
+    async def get(self, session_id):
+        record = self._records.get(session_id)
+        return dict(record, session_id=session_id) if record else None
+
+    async def update(self, session_id, **fields):
+        if session_id in self._records:
+            self._records[session_id].update(fields)
+
+    async def set_transfer(self, session_id):
+        await self.update(session_id, transfer=True)
+
+    async def append_turn(self, session_id, message):
+        turns = self._turns.get(session_id)
+        if turns is None:  # never created, or evicted
+            return
+        turns.append(dict(message))
+        del turns[:-SESSION_MAX_TURNS]
+
+    async def turns(self, session_id):
+        return list(self._turns.get(session_id, []))
+
+    async def find_by_number(self, caller_number):
+        return self._by_number.get(caller_number)
+
+
+class RedisSessionStore:
+    """
+    Store shared through Redis, so any worker can serve any session:
+    - `{prefix}:{id}` hash with the caller number, creation time and
+      JSON-encoded summary;
+    - `{prefix}:{id}:transfer`, set with a short TTL when the call is to be
+      transferred;
+    - `{prefix}:{id}:turns` stream of the call's turns, capped at
+      SESSION_MAX_TURNS;
+    - `{prefix}:number:{caller}` pointing to the caller's latest session ID.
+    Every write is one pipelined round trip that also refreshes the TTL.
+    `redis_client` may be a function returning the client, to create it on
+    first use.
+    """
+
+    JSON_FIELDS = ("summary",)
+
+    def __init__(
+        self,
+        redis_client,
+        prefix="session",
+        ttl=SESSION_TTL,
+        transfer_ttl=TRANSFER_TTL,
+    ):
+        self._redis = redis_client
+        self.prefix = prefix
+        self.ttl = ttl
+        self.transfer_ttl = transfer_ttl
+
+    @property
+    def redis(self):
+        return self._redis() if callable(self._redis) else self._redis
+
+    def _key(self, session_id):
+        return f"{self.prefix}:{session_id}"
+
+    async def create(self, session_id, caller_number, created_at):
+        key = self._key(session_id)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hset(
+                key,
+                mapping={"caller_number": caller_number, "created_at": created_at},
+            )
+            pipe.expire(key, self.ttl)
+            pipe.set(f"{self.prefix}:number:{caller_number}", session_id, ex=self.ttl)
+            await pipe.execute()
+
+    async def get(self, session_id):
+        key = self._key(session_id)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hgetall(key)
+            pipe.exists(f"{key}:transfer")
+            raw, transfer = await pipe.execute()
+        if not raw:
+            return None
+        record = {_text(k): _text(v) for k, v in raw.items()}
+        record["session_id"] = session_id
+        record["created_at"] = float(record["created_at"])
+        record["transfer"] = bool(transfer)
+        for field in self.JSON_FIELDS:
+            if field in record:
+                record[field] = json.loads(record[field])
+        return record
+
+    async def update(self, session_id, **fields):
+        mapping = {}
+        for field, value in fields.items():
+            mapping[field] = json.dumps(value) if field in self.JSON_FIELDS else value
+        key = self._key(session_id)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hset(key, mapping=mapping)
+            pipe.expire(key, self.ttl)
+            await pipe.execute()
+
+    async def set_transfer(self, session_id):
+        await self.redis.set(
+            f"{self._key(session_id)}:transfer", 1, ex=self.transfer_ttl
+        )
+
+    async def append_turn(self, session_id, message):
+        key = f"{self._key(session_id)}:turns"
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.xadd(
+                key,
+                {"role": message["role"], "content": message["content"]},
+                maxlen=SESSION_MAX_TURNS,
+                approximate=True,
+            )
+            pipe.expire(key, self.ttl)
+            await pipe.execute()
+
+    async def turns(self, session_id):
+        entries = await self.redis.xrange(f"{self._key(session_id)}:turns")
+        return [
+            {_text(k): _text(v) for k, v in fields.items()} for _, fields in entries
+        ]
+
+    async def find_by_number(self, caller_number):
+        return _text(await self.redis.get(f"{self.prefix}:number:{caller_number}"))
+
+
+async def benchmark(store, sessions=20, turns=50):
+    """Per-turn write latency of `store`, over interleaved sessions."""
+    timings = []
+
+    async def call(n):
+        session_id = f"bench-{n}-{time.time_ns()}"
+        await store.create(session_id, f"+1555{n:07d}", time.time())
+        for turn in range(turns):
+            message = {"role": "user", "content": f"turn {turn} " + "word " * 20}
+            started = time.perf_counter()
+            await store.append_turn(session_id, message)
+            timings.append(time.perf_counter() - started)
+        assert len(await store.turns(session_id)) == turns
+
+    started = time.perf_counter()
+    await asyncio.gather(*(call(n) for n in range(sessions)))
+    elapsed = time.perf_counter() - started
+    print(
+        f"{type(store).__name__:>22}: {len(timings)} turns in {elapsed:.2f}s,"
+        f" p50 {percentile(timings, 50) * 1000:.3f} ms"
+        f"  p99 {percentile(timings, 99) * 1000:.3f} ms per turn"
+    )
+
+
+def open_store(backend):
+    if backend == "memory":
+        return InMemorySessionStore()
+    if backend == "fakeredis":
+        # In-process Redis stand-in, not a runtime dependency
+        import fakeredis
+
+        return RedisSessionStore(fakeredis.FakeAsyncRedis())
+    import redis.asyncio as aioredis
+
+    return RedisSessionStore(
+        aioredis.Redis.from_url(os.getenv("REDISCLOUD_URL"), ssl_cert_reqs=None)
+    )
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--backend",
+        nargs="+",
+        choices=["memory", "fakeredis", "redis"],
+        default=["memory", "fakeredis"],
+    )
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=50)
+    args = parser.parse_args()
+    for backend in args.backend:
+        asyncio.run(benchmark(open_store(backend), args.sessions, args.turns))
@@ -0,0 +1,227 @@
+"""
+Per-call session state.
+
+Simulate concurrent calls and check that no state leaks between them
+(from the repository root):
+    python -m src.utils.sessions --calls 50
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import time
+import uuid
+from collections import OrderedDict
+
+from .conversation_memory import ConversationMemory
+from .metrics import metrics
+from .session_store import InMemorySessionStore
+
+logger = logging.getLogger(__name__)
+
+SESSION_REGISTRY_MAX = int(os.getenv("SESSION_REGISTRY_MAX", 1000))
+
+
+def session_id_for_call(call_sid):
+    """Session ID of a Twilio call, or a random one when there is no CallSid."""
+    return call_sid or str(uuid.uuid4())
+
+
+class Session:
+    """Everything one call owns. Mutations across awaits hold `lock`."""
+
+    def __init__(self, session_id, caller_number, memory, created_at=None):
+        self.session_id = session_id
+        self.caller_number = caller_number
+        self.memory = memory
+        self.summary = None
+        self.transfer = False
+        self.prefetch = None  # speculative retrieval, when enabled
+        self.created_at = created_at or time.time()
+        self.lock = asyncio.Lock()
+
+
+class SessionRegistry:
+    """
+    Live sessions of the calls this worker streams, written through to a
+    shared `store` so that any worker can answer for any session. Store
+    writes never fail a call: errors are logged and counted. The oldest
+    live sessions are evicted past `max_sessions`.
+    """
+
+    def __init__(self, summarize, store=None, max_sessions=SESSION_REGISTRY_MAX):
+        self.summarize = summarize
+        self.store = store if store is not None else InMemorySessionStore()
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, session_id):
+        return session_id in self._sessions
+
+    def _add(self, session_id, caller_number, created_at=None):
+        session = Session(
+            session_id,
+            caller_number,
+            ConversationMemory(self.summarize),
+            created_at,
+        )
+        self._sessions[session_id] = session
+        self._sessions.move_to_end(session_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+        return session
+
+    async def _write(self, operation, coro):
+        try:
+            with metrics.timer(f"session_store.{operation}"):
+                await coro
+        except Exception as e:
+            metrics.incr("session_store.errors")
+            logger.error(f"Session store {operation} failed: {e}")
+
+    async def create(self, session_id, caller_number="Unknown"):
+        session = self._add(session_id, caller_number)
+        await self._write(
+            "create", self.store.create(session_id, caller_number, session.created_at)
+        )
+        return session
+
+    def get(self, session_id):
+        return self._sessions.get(session_id)
+
+    def release(self, session_id):
+        """Drop the live state of a call that ended; its record stays stored."""
+        session = self._sessions.pop(session_id, None)
+        if session is not None and session.prefetch is not None:
+            session.prefetch.cancel()
+
+    def get_or_create(self, session_id):
+        session = self._sessions.get(session_id)
+        return session if session is not None else self._add(session_id, "Unknown")
+
+    async def open(self, session_id):
+        """
+        Live session for `session_id`, picking up the record written by the
+        worker that answered the call's webhook if it is not local.
+        """
+        session = self._sessions.get(session_id)
+        if session is not None:
+            return session
+        try:
+            record = await self.store.get(session_id)
+        except Exception as e:
+            logger.error(f"Session store read failed: {e}")
+            record = None
+        if record is None:
+            return await self.create(session_id)
+        session = self._add(session_id, record["caller_number"], record["created_at"])
+        session.transfer = record["transfer"]
+        return session
+
+    async def append_turn(self, session_id, message):
+        self.get_or_create(session_id).memory.append(message)
+        await self._write("append_turn", self.store.append_turn(session_id, message))
+
+    async def mark_transfer(self, session_id):
+        self.get_or_create(session_id).transfer = True
+        await self._write("set_transfer", self.store.set_transfer(session_id))
+
+    async def save_summary(self, session_id, summary):
+        self.get_or_create(session_id).summary = summary
+        await self._write("update", self.store.update(session_id, summary=summary))
+
+    async def record(self, session_id):
+        """Stored record of `session_id`, from whichever worker wrote it."""
+        try:
+            return await self.store.get(session_id)
+        except Exception as e:
+            logger.error(f"Session store read failed: {e}")
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            return {
+                "session_id": session_id,
+                "caller_number": session.caller_number,
+                "created_at": session.created_at,
+                "transfer": session.transfer,
+                "summary": session.summary,
+            }
+
+    async def turns(self, session_id):
+        """Every stored turn of `session_id`, not only those kept in memory."""
+        try:
+            return await self.store.turns(session_id)
+        except Exception as e:
+            logger.error(f"Session store read failed: {e}")
+            session = self._sessions.get(session_id)
+            return list(session.memory) if session is not None else []
+
+    async def find(self, caller_number):
+        """Record of the latest session of `caller_number`."""
+        session_id = await self.store.find_by_number(caller_number)
+        return await self.record(session_id) if session_id else None
+
+
+async def simulate_calls(calls=50, turns=20, store=None):
+    """Drive `calls` interleaved fake calls and report any state they share."""
+
+    async def summarize(previous_summary, older):
+        await asyncio.sleep(random.uniform(0, 0.01))
+        return " ".join(filter(None, [previous_summary] + [t["content"] for t in older]))
+
+    registry = SessionRegistry(summarize, store)
+
+    async def call(n):
+        call_sid = f"CA{n:032x}"
+        session = await registry.create(session_id_for_call(call_sid), f"+1555{n:07d}")
+        for turn in range(turns):
+            await asyncio.sleep(random.uniform(0, 0.005))
+            await registry.append_turn(
+                call_sid, {"role": "user", "content": f"{call_sid}:{turn}"}
+            )
+        if n % 2:
+            await registry.mark_transfer(call_sid)
+        await session.memory.flush()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(call(n) for n in range(calls)))
+    elapsed = time.perf_counter() - started
+
+    errors = 0
+    for n in range(calls):
+        call_sid = f"CA{n:032x}"
+        expected = [f"{call_sid}:{turn}" for turn in range(turns)]
+        record = await registry.find(f"+1555{n:07d}")
+        if record is None or record["session_id"] != call_sid:
+            errors += 1
+            continue
+        errors += record["transfer"] != bool(n % 2)
+        stored = [t["content"] for t in await registry.store.turns(call_sid)]
+        errors += stored != expected
+        # Summary plus recent turns must hold exactly this call's turns
+        memory = registry.get(call_sid).memory
+        contents = memory.summary.split() + [t["content"] for t in memory]
+        errors += contents != expected
+    print(f"{calls} calls x {turns} turns in {elapsed:.2f}s, {errors} cross-talk errors")
+    return errors
+
+
+if __name__ == "__main__":
+    from .session_store import open_store
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--calls", type=int, default=50)
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument(
+        "--backend", choices=["memory", "fakeredis", "redis"], default="memory"
+    )
+    args = parser.parse_args()
+    errors = asyncio.run(
+        simulate_calls(args.calls, args.turns, open_store(args.backend))
+    )
+    raise SystemExit(1 if errors else 0)
@@ -0,0 +1,194 @@
+"""
+Energy-based gate that keeps long silences of the caller from being sent
+to the Realtime API.
+
+Check on a recording that every voiced frame, with its prefix padding, is
+still forwarded, and report what is saved (from the repository root):
+    python -m src.utils.silence_gate recording.wav --threshold 300
+Without a recording, the check runs on a synthesized call alternating
+voiced segments and background noise.
+"""
+
+import argparse
+import base64
+import os
+import tempfile
+from collections import deque
+
+import numpy as np
+
+from .audio import (
+    FRAME_MS,
+    SAMPLE_RATE,
+    load_ulaw,
+    payload_bytes,
+    pcm16_to_ulaw,
+    ulaw_frames,
+    ulaw_to_pcm16,
+    write_ulaw_wav,
+)
+from .metrics import metrics
+
+SILENCE_GATE = os.getenv("SILENCE_GATE", "false").lower() == "true"
+# Frame RMS, in 16-bit PCM units, above which a frame counts as voiced
+SILENCE_GATE_RMS = float(os.getenv("SILENCE_GATE_RMS", 300))
+# Forward one silent frame in this many while gated (0 drops them all)
+SILENCE_GATE_KEEP_EVERY = int(os.getenv("SILENCE_GATE_KEEP_EVERY", 0))
+
+
+def frame_rms(audio):
+    pcm = ulaw_to_pcm16(audio).astype(np.float32)
+    return float(np.sqrt(np.mean(pcm * pcm))) if len(pcm) else 0.0
+
+
+class SilenceGate:
+    """
+    Drops sustained silence from a stream of base64 μ-law frames.
+    - A frame with RMS of at least `threshold` opens the gate. The last
+      `prefix_ms` of held-back frames are released before it, so server VAD
+      still gets its prefix padding before the speech onset.
+    - After the last voiced frame, `hangover_ms` of silence still passes,
+      which server VAD needs to detect the end of the turn.
+    - Past that, silent frames are held back (only the last `prefix_ms`
+      worth is kept) and dropped, except one in `keep_every` if set.
+    """
+
+    def __init__(
+        self,
+        threshold=SILENCE_GATE_RMS,
+        prefix_ms=300,
+        hangover_ms=800,
+        keep_every=SILENCE_GATE_KEEP_EVERY,
+    ):
+        self.threshold = threshold
+        self.hangover_frames = hangover_ms // FRAME_MS
+        self.keep_every = keep_every
+        self._prefix = deque(maxlen=max(prefix_ms // FRAME_MS, 1))
+        self._hangover = 0
+        self._silent = 0
+        self.frames_dropped = 0
+        self.bytes_saved = 0
+
+    def _drop(self, payload):
+        size = payload_bytes(payload)
+        self.frames_dropped += 1
+        self.bytes_saved += size
+        metrics.incr("silence_gate.frames_dropped")
+        metrics.incr("silence_gate.bytes_saved", size)
+
+    def process(self, payload):
+        """Frames to forward now, oldest first, after receiving `payload`."""
+        if frame_rms(base64.b64decode(payload)) >= self.threshold:
+            released = list(self._prefix)
+            self._prefix.clear()
+            released.append(payload)
+            self._hangover = self.hangover_frames
+            self._silent = 0
+            return released
+        if self._hangover > 0:
+            self._hangover -= 1
+            return [payload]
+        self._silent += 1
+        if self.keep_every and self._silent % self.keep_every == 0:
+            return [payload]
+        if len(self._prefix) == self._prefix.maxlen:
+            self._drop(self._prefix[0])
+        self._prefix.append(payload)
+        return []
+
+
+def synthesize_call(
+    path,
+    segments=((1.0, False), (1.2, True), (2.0, False), (0.8, True), (1.5, False)),
+    seed=0,
+):
+    """
+    Write a μ-law WAV of (seconds, voiced) `segments`: phone-line noise
+    throughout, with voiced segments of a 140 Hz harmonic voice whose
+    loudness rises and falls with 4 Hz syllables and ramps in over 40 ms.
+    """
+    rng = np.random.default_rng(seed)
+    parts = []
+    for seconds, voiced in segments:
+        n = int(seconds * SAMPLE_RATE)
+        samples = rng.normal(0, 30, n)  # line noise, far under the threshold
+        if voiced:
+            t = np.arange(n) / SAMPLE_RATE
+            voice = sum(np.sin(2 * np.pi * 140 * k * t) / k for k in range(1, 8))
+            syllables = 0.4 + 0.6 * np.abs(np.sin(2 * np.pi * 4 * t))
+            onset = np.minimum(t / 0.04, 1.0)
+            samples += 5000 * voice * syllables * onset
+        parts.append(samples)
+    pcm = np.clip(np.concatenate(parts), -32768, 32767).astype(np.int16)
+    write_ulaw_wav(path, pcm16_to_ulaw(pcm).tobytes())
+
+
+def gate_report(frames, threshold=SILENCE_GATE_RMS, prefix_ms=300, hangover_ms=800):
+    """
+    Run the gate over base64 `frames` and count what it dropped, the voiced
+    frames and the `prefix_ms` before each speech onset it lost, and whether
+    it kept the forwarded frames in order.
+    """
+    index = {id(frame): i for i, frame in enumerate(frames)}
+    gate = SilenceGate(threshold, prefix_ms, hangover_ms, keep_every=0)
+    forwarded = []
+    for frame in frames:
+        forwarded.extend(index[id(f)] for f in gate.process(frame))
+
+    voiced = [frame_rms(base64.b64decode(f)) >= threshold for f in frames]
+    kept = set(forwarded)
+    prefix_frames = prefix_ms // FRAME_MS
+    missing = [i for i, v in enumerate(voiced) if v and i not in kept]
+    # Onsets after a gap: their prefix padding must have been released
+    missing_prefix = [
+        i
+        for i, v in enumerate(voiced)
+        if v and i > 0 and (i - 1) not in kept
+        for j in range(max(i - prefix_frames, 0), i)
+        if j not in kept
+    ]
+    return {
+        "frames": len(frames),
+        "voiced": sum(voiced),
+        "dropped": gate.frames_dropped,
+        "bytes_saved": gate.bytes_saved,
+        "voiced_lost": len(missing),
+        "prefix_lost": len(missing_prefix),
+        "in_order": forwarded == sorted(forwarded),
+    }
+
+
+def check_recording(path, threshold=SILENCE_GATE_RMS, prefix_ms=300, hangover_ms=800):
+    """
+    Run the gate over a WAV recording and verify that every voiced frame,
+    and the `prefix_ms` before each speech onset, is forwarded in order.
+    """
+    report = gate_report(ulaw_frames(load_ulaw(path)), threshold, prefix_ms, hangover_ms)
+    frames, dropped = report["frames"], report["dropped"]
+    seconds = frames * FRAME_MS / 1000
+    print(
+        f"{path}: {frames} frames ({seconds:.1f}s), {report['voiced']} voiced,"
+        f" {dropped} dropped ({dropped / frames:.0%}),"
+        f" {report['bytes_saved']} bytes saved"
+    )
+    print(
+        f"  voiced frames lost: {report['voiced_lost']}, prefix frames lost:"
+        f" {report['prefix_lost']}, order preserved: {report['in_order']}"
+    )
+    return not report["voiced_lost"] and not report["prefix_lost"] and report["in_order"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("recording", nargs="?")
+    parser.add_argument("--threshold", type=float, default=SILENCE_GATE_RMS)
+    parser.add_argument("--prefix-ms", type=int, default=300)
+    parser.add_argument("--hangover-ms", type=int, default=800)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        recording = args.recording
+        if recording is None:
+            recording = os.path.join(tmp, "synthesized_call.wav")
+            synthesize_call(recording)
+        ok = check_recording(recording, args.threshold, args.prefix_ms, args.hangover_ms)
+    raise SystemExit(0 if ok else 1)
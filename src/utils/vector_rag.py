@@ -1,14 +1,68 @@
+"""
+Knowledge base ingestion and a command-line RAG check for the
+respiratory_disease_guide collection.
+
+Run from the repository root:
+    python -m src.utils.vector_rag ingest            # only new or changed PDFs
+    python -m src.utils.vector_rag ingest --rebuild  # recreate the collection
+    python -m src.utils.vector_rag query "I have a fever"
+    python -m src.utils.vector_rag bench-chunks "I have a fever" "What is hemoptysis?"
+"""
+
+import argparse
+import glob
+import hashlib
+import json
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 from openai import OpenAI
 from dotenv import load_dotenv
-from qdrant_client import QdrantClient
-import pymupdf4llm
+from qdrant_client import QdrantClient, models
+import redis
+from src.utils.bm25 import BM25_INDEX_PATH, BM25Index
+from src.utils.chunker import (
+    CHUNK_OVERLAP_TOKENS,
+    CHUNK_TOKENS,
+    chunk_pages,
+    count_tokens,
+    get_encoding,
+)
+from src.utils.embeddings import EmbeddingCache, EmbeddingService, SQLiteEmbeddingStore
+from src.utils.local_index import LocalVectorIndex
+from src.utils.metrics import percentile
+from src.utils.pdf_extract import extract_documents
+from src.utils.semantic_cache import generation_key
 
-load_dotenv()
+COLLECTION_NAME = "respiratory_disease_guide"
+KNOWLEDGE_BASE_DIR = os.path.join(os.path.dirname(__file__), "knowledge_base")
+EMBEDDING_SIZE = 1536
+EMBED_BATCH_SIZE = 128  # inputs per embeddings.create call
+EMBED_CONCURRENCY = 4  # embedding requests in flight at once
+UPSERT_BATCH_SIZE = 512  # points per upsert call
+INGEST_CACHE_DIR = os.getenv("INGEST_CACHE_DIR", ".cache")
+MANIFEST_PATH = os.path.join(INGEST_CACHE_DIR, "kb_manifest.json")
+MARKDOWN_CACHE_DIR = os.path.join(INGEST_CACHE_DIR, "markdown")
+# Bump whenever chunking changes so every document is re-chunked
+CHUNKER_VERSION = f"markdown-sentences-{CHUNK_TOKENS}-{CHUNK_OVERLAP_TOKENS}"
 
-client = OpenAI()
-client.api_key = os.getenv("OPENAI_API_KEY")
 
+def get_clients():
+    load_dotenv()
+    client = OpenAI()
+    client.api_key = os.getenv("OPENAI_API_KEY")
+    vectordb_client = QdrantClient(
+        url=os.getenv("QDRANT_URL"), api_key=os.getenv("QDRANT_API_KEY")
+    )
+    # Unchanged chunks are served from the embedding cache on re-ingestion.
+    # Chunk vectors stay in a local file rather than the shared Redis, which
+    # only holds the (expiring) query embeddings
+    embedding_service = EmbeddingService(client, EmbeddingCache(SQLiteEmbeddingStore()))
+    return client, vectordb_client, embedding_service
+
+
+# Previous word-count chunker, kept as the bench-chunks baseline
 def split_text_into_chunks(text, max_tokens=1024):
     chunks = []
     words = text.split()
@@ -17,63 +71,314 @@ def split_text_into_chunks(text, max_tokens=1024):
         chunks.append(chunk)
     return chunks
 
-pdf_paths = ['./src/utils/knowledge_base/one.pdf', './src/utils/knowledge_base/two.pdf', './src/utils/knowledge_base/three.pdf', 
-             './src/utils/knowledge_base/four.pdf', './src/utils/knowledge_base/five.pdf', './src/utils/knowledge_base/six.pdf',
-             './src/utils/knowledge_base/seven.pdf', './src/utils/knowledge_base/eight.pdf', './src/utils/knowledge_base/nine.pdf',
-             './src/utils/knowledge_base/ten.pdf', './src/utils/knowledge_base/eleven.pdf'
-             ]
 
-for pdf_path in pdf_paths:
-    extracted_text = pymupdf4llm.to_markdown(pdf_path)
-    chunks = split_text_into_chunks(extracted_text)
+def list_pdfs(directory=KNOWLEDGE_BASE_DIR):
+    return sorted(glob.glob(os.path.join(directory, "*.pdf")))
 
-def get_embedding(text, model="text-embedding-3-small"):
-   text = text.replace("\n", " ")
-   return client.embeddings.create(input = [text], model=model).data[0].embedding
 
-chunk_embeddings = [{"text": chunk, "embedding": get_embedding(chunk)} for chunk in chunks]
+def point_id(source, text):
+    """Stable point ID derived from the chunk's source and content."""
+    digest = hashlib.sha256(f"{source}\0{text}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") >> 1  # fits a signed 64-bit int
 
-vectordb_client = QdrantClient(
-    url=os.getenv("QDRANT_URL"), 
-    api_key=os.getenv("QDRANT_API_KEY")
-)
 
-# Uncomment to update knowledge base
-vectordb_client.recreate_collection(
-    collection_name="respiratory_disease_guide",
-    vectors_config={"size": 1536, "distance": "Cosine"}
-)
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_cached_pages(content_hash):
+    cache_path = os.path.join(MARKDOWN_CACHE_DIR, f"{content_hash}.json")
+    if not os.path.exists(cache_path):
+        return None
+    with open(cache_path, encoding="utf-8") as f:
+        return [tuple(page) for page in json.load(f)]
+
+
+def save_cached_pages(content_hash, pages):
+    os.makedirs(MARKDOWN_CACHE_DIR, exist_ok=True)
+    cache_path = os.path.join(MARKDOWN_CACHE_DIR, f"{content_hash}.json")
+    with open(cache_path, "w", encoding="utf-8") as f:
+        json.dump(pages, f, ensure_ascii=False)
+
+
+def iter_extracted(documents, workers=None):
+    """
+    Yield (pdf_path, content_hash, pages) for each (pdf_path, content_hash),
+    from the on-disk markdown cache or else from the extraction process pool,
+    as each document becomes available.
+    """
+    uncached = {}
+    for pdf_path, content_hash in documents:
+        pages = load_cached_pages(content_hash)
+        if pages is None:
+            uncached[pdf_path] = content_hash
+        else:
+            yield pdf_path, content_hash, pages
+    for pdf_path, pages in extract_documents(list(uncached), workers):
+        save_cached_pages(uncached[pdf_path], pages)
+        yield pdf_path, uncached[pdf_path], pages
+
+
+def chunk_document(source, pages):
+    """Chunk one document's pages, returning one payload dict per chunk."""
+    return [dict(chunk, source=source) for chunk in chunk_pages(pages)]
+
+
+def load_manifest():
+    """Per-PDF content hash and chunk IDs from the previous ingestion."""
+    if not os.path.exists(MANIFEST_PATH):
+        return {"chunker": CHUNKER_VERSION, "documents": {}}
+    with open(MANIFEST_PATH, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(manifest):
+    os.makedirs(os.path.dirname(MANIFEST_PATH), exist_ok=True)
+    tmp_path = f"{MANIFEST_PATH}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, MANIFEST_PATH)
+
+
+def embed_chunks(
+    embedding_service,
+    texts,
+    batch_size=EMBED_BATCH_SIZE,
+    concurrency=EMBED_CONCURRENCY,
+):
+    """Embed `texts` in batched requests, at most `concurrency` at a time."""
+    batches = [texts[i : i + batch_size] for i in range(0, len(texts), batch_size)]
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = pool.map(embedding_service.embed_many, batches)
+        return [vector for batch in results for vector in batch]
+
+
+def upsert_chunks(vectordb_client, ids, vectors, payloads, batch_size=UPSERT_BATCH_SIZE):
+    for start in range(0, len(ids), batch_size):
+        end = start + batch_size
+        vectordb_client.upsert(
+            collection_name=COLLECTION_NAME,
+            points=models.Batch(
+                ids=ids[start:end],
+                vectors=[vector.tolist() for vector in vectors[start:end]],
+                payloads=payloads[start:end],
+            ),
+            wait=True,
+        )
+
+
+def invalidate_answer_caches():
+    """Bump the collection generation so running servers drop cached answers."""
+    if os.getenv("REDISCLOUD_URL"):
+        redis.Redis.from_url(os.getenv("REDISCLOUD_URL"), ssl_cert_reqs=None).incr(
+            generation_key(COLLECTION_NAME)
+        )
+
+
+def update_local_index(vectordb_client, removed_ids, ids, vectors, payloads):
+    """Apply the same changes to the RAG_BACKEND=local snapshot."""
+    try:
+        index = LocalVectorIndex.load(mmap=False)
+    except FileNotFoundError:
+        index = None
+    if index is not None:
+        index.update(removed_ids, ids, vectors, payloads).save()
+        return
+
+    # No usable snapshot: rebuild it from the whole collection
+    points, offset = [], None
+    while True:
+        batch, offset = vectordb_client.scroll(
+            collection_name=COLLECTION_NAME,
+            limit=UPSERT_BATCH_SIZE,
+            offset=offset,
+            with_payload=True,
+            with_vectors=True,
+        )
+        points.extend(batch)
+        if offset is None:
+            break
+    LocalVectorIndex.build(
+        [p.id for p in points], [p.vector for p in points], [p.payload for p in points]
+    ).save()
+
+
+def collection_sources(vectordb_client):
+    """Source PDF of every point in the collection (None for unattributed ones)."""
+    sources, offset = {}, None
+    while True:
+        batch, offset = vectordb_client.scroll(
+            collection_name=COLLECTION_NAME,
+            limit=UPSERT_BATCH_SIZE,
+            offset=offset,
+            with_payload=["source"],
+            with_vectors=False,
+        )
+        for point in batch:
+            sources[point.id] = (point.payload or {}).get("source")
+        if offset is None:
+            return sources
+
+
+def build_bm25_index():
+    """Rebuild the lexical index over the same chunks as the local snapshot."""
+    index = LocalVectorIndex.load()
+    BM25Index.build(
+        index.ids, [index.payloads[i] for i in range(len(index))]
+    ).save()
 
-for idx, chunk in enumerate(chunk_embeddings):
-    vectordb_client.upsert(
-        collection_name="respiratory_disease_guide",
-        points=[{
-            "id": idx,  # Use the integer directly
-            "vector": chunk["embedding"],
-            "payload": {"text": chunk["text"]}
-        }]
+
+def ingest(
+    pdf_paths,
+    batch_size=EMBED_BATCH_SIZE,
+    concurrency=EMBED_CONCURRENCY,
+    rebuild=False,
+    workers=None,
+    full=True,
+):
+    """
+    Bring the collection in line with `pdf_paths`, doing work only for
+    documents whose content changed since the last run.
+    - Unchanged PDFs (same content hash, all points present) are skipped.
+    - Changed or new PDFs are re-chunked from cached markdown where possible,
+      otherwise extracted by a pool of `workers` processes, and only chunks
+      that are not in the collection yet are embedded and upserted.
+    - Points of chunks that disappeared are deleted. A `full` run (every
+      PDF of the knowledge base) also deletes every point of any other
+      source, including those of older ingestions; otherwise points of
+      PDFs outside `pdf_paths` are left alone.
+    The collection's own point IDs are the reference, so a run without the
+    local manifest still reconciles it.
+    """
+    # Chunk sizes are stored for good, so never chunk on estimated counts
+    get_encoding(exact=True)
+    _, vectordb_client, embedding_service = get_clients()
+    started = time.perf_counter()
+
+    manifest = load_manifest()
+    rebuild = rebuild or not vectordb_client.collection_exists(COLLECTION_NAME)
+    if rebuild:
+        manifest = {"chunker": CHUNKER_VERSION, "documents": {}}
+        vectordb_client.recreate_collection(
+            collection_name=COLLECTION_NAME,
+            vectors_config={"size": EMBEDDING_SIZE, "distance": "Cosine"},
+        )
+    previous = manifest["documents"]
+    # A different chunker invalidates every document, but their old points
+    # must still be deleted
+    rechunk = manifest.get("chunker") != CHUNKER_VERSION
+    manifest["chunker"] = CHUNKER_VERSION
+    # Chunk IDs hash their content, so any point already there is current
+    collection = {} if rebuild else collection_sources(vectordb_client)
+    indexed_ids = set(collection)
+
+    sources = {os.path.basename(pdf_path) for pdf_path in pdf_paths}
+    documents = {} if full else {
+        source: doc for source, doc in previous.items() if source not in sources
+    }
+    changed, new_chunks, new_ids = [], [], []
+    for pdf_path in pdf_paths:
+        source = os.path.basename(pdf_path)
+        content_hash = file_hash(pdf_path)
+        if (
+            not rechunk
+            and source in previous
+            and previous[source]["sha256"] == content_hash
+            and indexed_ids.issuperset(previous[source]["chunk_ids"])
+        ):
+            documents[source] = previous[source]
+        else:
+            changed.append((pdf_path, content_hash))
+
+    for pdf_path, content_hash, pages in iter_extracted(changed, workers):
+        source = os.path.basename(pdf_path)
+        chunk_ids = []
+        for chunk in chunk_document(source, pages):
+            chunk_id = point_id(source, chunk["text"])
+            chunk_ids.append(chunk_id)
+            if chunk_id not in indexed_ids:
+                indexed_ids.add(chunk_id)
+                new_chunks.append(chunk)
+                new_ids.append(chunk_id)
+        documents[source] = {"sha256": content_hash, "chunk_ids": chunk_ids}
+    extracted = time.perf_counter()
+
+    current_ids = {i for doc in documents.values() for i in doc["chunk_ids"]}
+    if full:
+        stale = set(collection)
+    else:
+        stale = {i for i, source in collection.items() if source in sources}
+        for source in sources & previous.keys():
+            stale.update(previous[source]["chunk_ids"])
+    removed_ids = sorted(stale - current_ids)
+
+    texts = [chunk["text"] for chunk in new_chunks]
+    vectors = embed_chunks(embedding_service, texts, batch_size, concurrency)
+    embedded = time.perf_counter()
+
+    upsert_chunks(vectordb_client, new_ids, vectors, new_chunks)
+    if removed_ids:
+        vectordb_client.delete(
+            collection_name=COLLECTION_NAME,
+            points_selector=models.PointIdsList(points=removed_ids),
+        )
+    upserted = time.perf_counter()
+
+    manifest["documents"] = documents
+    save_manifest(manifest)
+    if rebuild:
+        LocalVectorIndex.build(new_ids, vectors, new_chunks).save()
+    elif new_ids or removed_ids:
+        update_local_index(vectordb_client, removed_ids, new_ids, vectors, new_chunks)
+    if rebuild or new_ids or removed_ids or not os.path.isdir(BM25_INDEX_PATH):
+        build_bm25_index()
+    if rebuild or new_ids or removed_ids:
+        invalidate_answer_caches()
+
+    total = time.perf_counter() - started
+    print(
+        f"{len(pdf_paths)} PDFs: {len(new_ids)} chunks added,"
+        f" {len(removed_ids)} removed, {len(current_ids)} indexed in {total:.2f}s"
+    )
+    print(f"  extract: {extracted - started:.2f}s")
+    print(
+        f"  embed:   {embedded - extracted:.2f}s"
+        f" ({len(new_ids) / max(embedded - extracted, 1e-9):.1f} chunks/s)"
+    )
+    print(
+        f"  upsert:  {upserted - embedded:.2f}s"
+        f" ({len(new_ids) / max(upserted - embedded, 1e-9):.1f} chunks/s)"
     )
 
+
 # retrieval
-def query_qdrant(query_text):
-    query_embedding = get_embedding(query_text)
-    search_result = vectordb_client.search(
-        collection_name="respiratory_disease_guide",
-        query_vector=query_embedding,
+def query_qdrant(vectordb_client, embedding_service, query_text):
+    query_embedding = embedding_service.embed(query_text)
+    search_result = vectordb_client.query_points(
+        collection_name=COLLECTION_NAME,
+        query=query_embedding.tolist(),
         limit=5
     )
-    return [hit.payload["text"] for hit in search_result]
+    return [hit.payload["text"] for hit in search_result.points]
 
-def rag_system(user_query):
-    retrieved_contexts = query_qdrant(user_query)
+def rag_messages(user_query, retrieved_contexts):
     context_text = "\n".join(retrieved_contexts)
-    
-    messages = [
+    return [
         {"role": "system", "content": "You are an AI doctor specializing in respiratory diseases. Respond to the user in a professional and conversational way. Provide clear, empathetic, and helpful guidance. Not too structured."},
         {"role": "system", "content": f"Retrieved Context: {context_text}"},
         {"role": "user", "content": user_query}
     ]
-    
+
+
+def rag_system(user_query):
+    client, vectordb_client, embedding_service = get_clients()
+    retrieved_contexts = query_qdrant(vectordb_client, embedding_service, user_query)
+    messages = rag_messages(user_query, retrieved_contexts)
+
     # Generate the response using ChatCompletion endpoint
     response = client.chat.completions.create(
         model="gpt-4o-mini",
@@ -84,9 +389,104 @@ def rag_system(user_query):
 
     return response.choices[0].message.content.strip()
 
-user_query = "I have a fever"
-response = rag_system(user_query)
-print(response)
+
+def bench_chunks(queries, pdf_paths, limit=5, workers=None):
+    """
+    Compare the word-count chunker with the token-aware one: chunk sizes,
+    prompt tokens per query and end-to-end latency (embed, search, answer).
+    Each chunking is searched through an in-memory LocalVectorIndex.
+    """
+    get_encoding(exact=True)
+    client, _, embedding_service = get_clients()
+    documents = [
+        (os.path.basename(pdf_path), pages)
+        for pdf_path, _, pages in iter_extracted(
+            [(p, file_hash(p)) for p in pdf_paths], workers
+        )
+    ]
+    chunkers = {
+        "words-1024": lambda pages: split_text_into_chunks(
+            "\n".join(text for _, text in pages)
+        ),
+        CHUNKER_VERSION: lambda pages: [c["text"] for c in chunk_pages(pages)],
+    }
+
+    for name, chunker in chunkers.items():
+        texts = [text for _, pages in documents for text in chunker(pages)]
+        vectors = embed_chunks(embedding_service, texts)
+        index = LocalVectorIndex.build(
+            range(len(texts)), vectors, [{"text": text} for text in texts]
+        )
+        sizes = [count_tokens(text) for text in texts]
+
+        prompt_tokens, latencies = [], []
+        for query in queries:
+            started = time.perf_counter()
+            hits = index.search(embedding_service.embed(query), limit)
+            response = client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=rag_messages(query, [hit.payload["text"] for hit in hits]),
+                max_tokens=200,
+                temperature=0.7,
+            )
+            latencies.append(time.perf_counter() - started)
+            prompt_tokens.append(response.usage.prompt_tokens)
+
+        print(f"{name}: {len(texts)} chunks")
+        print(
+            f"  tokens/chunk: mean {sum(sizes) / len(sizes):.0f}"
+            f"  p50 {percentile(sizes, 50)}  max {max(sizes)}"
+        )
+        if queries:
+            print(f"  prompt tokens/query: mean {sum(prompt_tokens) / len(queries):.0f}")
+            print(
+                f"  end-to-end latency: p50 {percentile(latencies, 50):.2f}s"
+                f"  max {max(latencies):.2f}s"
+            )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="respiratory_disease_guide knowledge base")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ingest_parser = commands.add_parser("ingest", help="rebuild the collection from the PDFs")
+    ingest_parser.add_argument("pdfs", nargs="*", help="defaults to every PDF in knowledge_base/")
+    ingest_parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE)
+    ingest_parser.add_argument("--concurrency", type=int, default=EMBED_CONCURRENCY)
+    ingest_parser.add_argument(
+        "--workers", type=int, default=None, help="extraction processes (default: CPU count)"
+    )
+    ingest_parser.add_argument(
+        "--rebuild", action="store_true", help="recreate the collection from scratch"
+    )
+
+    query_parser = commands.add_parser("query", help="answer a question with RAG")
+    query_parser.add_argument("query")
+
+    bench_parser = commands.add_parser(
+        "bench-chunks", help="compare chunkers on prompt size and latency"
+    )
+    bench_parser.add_argument("queries", nargs="*")
+    bench_parser.add_argument("--workers", type=int, default=None)
+
+    args = parser.parse_args(argv)
+    if args.command == "ingest":
+        ingest(
+            args.pdfs or list_pdfs(),
+            args.batch_size,
+            args.concurrency,
+            args.rebuild,
+            args.workers,
+            full=not args.pdfs,
+        )
+    elif args.command == "bench-chunks":
+        bench_chunks(args.queries, list_pdfs(), workers=args.workers)
+    else:
+        print(rag_system(args.query))
+
+
+if __name__ == "__main__":
+    main()
 
 ### CHECKER
 # def check_number_of_points(vectordb_client, collection_name):
@@ -95,4 +495,4 @@ print(response)
 
 # collection_name = "respiratory_disease_guide"
 # number_of_points = check_number_of_points(vectordb_client, collection_name)
-# print(f"The collection '{collection_name}' contains {number_of_points} points.")
\ No newline at end of file
+# print(f"The collection '{collection_name}' contains {number_of_points} points.")
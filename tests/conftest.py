@@ -0,0 +1,33 @@
+import os
+import sys
+
+import pytest
+
+# main.py reads its configuration at import time
+os.environ.setdefault("TWILIO_ACCOUNT_SID", "ACtest")
+os.environ.setdefault("TWILIO_AUTH_TOKEN", "test")
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+os.environ.setdefault("REDISCLOUD_URL", "rediss://:test@localhost:6379")
+os.environ.setdefault("SESSION_STORE", "memory")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class WordEncoding:
+    """One token per whitespace-separated word, so counts are easy to follow."""
+
+    def encode(self, text, **kwargs):
+        return text.split()
+
+    def decode(self, tokens):
+        return " ".join(tokens)
+
+
+@pytest.fixture
+def word_tokens(monkeypatch):
+    from src.utils import chunker, prompt_packer
+
+    encoding = WordEncoding()
+    monkeypatch.setattr(chunker, "get_encoding", lambda exact=False: encoding)
+    monkeypatch.setattr(prompt_packer, "get_encoding", lambda exact=False: encoding)
+    return encoding
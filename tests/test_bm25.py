@@ -0,0 +1,58 @@
+import pytest
+
+from src.utils.bm25 import BM25Index, reciprocal_rank_fusion, tokenize
+from src.utils.local_index import Hit
+
+TEXTS = {
+    10: "Hemoptysis means coughing up blood from the lungs.",
+    11: "A cough that lasts weeks can follow a cold.",
+    12: "Asthma causes wheezing, a tight chest and a cough at night.",
+    13: "Cough cough cough, said the very long note about coughs and colds"
+    " and many other unrelated words padding it out further still.",
+}
+
+
+@pytest.fixture
+def index():
+    ids = list(TEXTS)
+    return BM25Index.build(ids, [{"text": TEXTS[i]} for i in ids])
+
+
+def test_tokenize_drops_stopwords_and_punctuation():
+    assert tokenize("What is the cough, and why?") == ["cough"]
+
+
+def test_rare_terms_outrank_common_ones(index):
+    hits = index.search("cough with blood", limit=4)
+    assert hits[0].id == 10
+    assert hits[0].payload == {"text": TEXTS[10]}
+    assert [h.score for h in hits] == sorted((h.score for h in hits), reverse=True)
+
+
+def test_longer_documents_need_more_matches(index):
+    # Same single match on "cough": the short chunks beat the padded one
+    scores = {hit.id: hit.score for hit in index.search("cough", limit=4)}
+    assert scores[11] > scores[12]
+    assert set(scores) == {11, 12, 13}
+
+
+def test_search_respects_limit_and_ignores_unknown_terms(index):
+    assert len(index.search("cough", limit=2)) == 2
+    assert index.search("what is the zzz") == []
+
+
+def test_saved_index_searches_the_same(index, tmp_path):
+    index.save(str(tmp_path))
+    loaded = BM25Index.load(str(tmp_path))
+    assert loaded.search("wheezing at night") == index.search("wheezing at night")
+
+
+def test_fusion_favours_points_ranked_well_by_both_retrievers():
+    vector = [Hit(1, 0.9, {"text": "a"}), Hit(2, 0.8, {"text": "b"})]
+    lexical = [Hit(3, 7.0, {"text": "c"}), Hit(2, 5.0, {"text": "b"})]
+    fused = reciprocal_rank_fusion([vector, lexical], limit=2, k=60)
+
+    assert [hit.id for hit in fused] == [2, 1]
+    assert fused[0].score == pytest.approx(2 / 62)
+    assert fused[1].score == pytest.approx(1 / 61)
+    assert fused[0].payload == {"text": "b"}
@@ -0,0 +1,74 @@
+from src.utils.chunker import (
+    HEADING_RE,
+    SENTENCE_RE,
+    chunk_pages,
+    count_tokens,
+    overlap_tail,
+)
+
+
+def sentences(prefix, n):
+    return " ".join(f"{prefix} sentence {i} ends." for i in range(n))
+
+
+def test_chunks_stay_in_budget_and_open_with_their_heading(word_tokens):
+    pages = [(1, "# Cough\n\n" + sentences("Cough", 30)), (2, sentences("More", 10))]
+    chunks = chunk_pages(pages, max_tokens=40, overlap_tokens=8)
+
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert chunk["text"].startswith("# Cough\n\n")
+        assert count_tokens(chunk["text"]) <= 40 + 8
+    assert chunks[0]["page"] == 1 and chunks[-1]["page_end"] == 2
+
+
+def test_chunks_break_between_sentences(word_tokens):
+    chunks = chunk_pages([(1, "# Cough\n\n" + sentences("Cough", 30))], 40, 0)
+    for chunk in chunks:
+        body = chunk["text"].split("\n\n", 1)[1]
+        assert body.startswith("Cough sentence") and body.endswith("ends.")
+
+
+def test_split_paragraph_carries_sentence_overlap(word_tokens):
+    chunks = chunk_pages([(1, "# Cough\n\n" + sentences("Cough", 30))], 40, 8)
+    bodies = [SENTENCE_RE.split(c["text"].split("\n\n", 1)[1]) for c in chunks]
+    for previous, body in zip(bodies, bodies[1:]):
+        # Sentences are 4 tokens: the last two of a chunk open the next one
+        assert body[:2] == previous[-2:]
+
+
+def test_overlap_stays_within_a_section(word_tokens):
+    cough, fever = sentences("Cough", 12), sentences("Fever", 12)
+    text = f"# Cough\n\n{cough}\n\n# Fever\n\n{fever}"
+    chunks = chunk_pages([(1, text)], max_tokens=40, overlap_tokens=8, min_tokens=0)
+    fever = [c for c in chunks if c["text"].startswith("# Fever")]
+    assert fever and "Cough" not in fever[0]["text"]
+
+
+def test_no_chunk_ends_with_a_heading(word_tokens):
+    text = (
+        "# Short\n\nA brief note.\n\n# Long\n\n"
+        + " ".join(["word"] * 70)
+        + "\n\n# Empty"
+    )
+    chunks = chunk_pages([(1, text)], max_tokens=40, overlap_tokens=8)
+    for chunk in chunks:
+        assert not HEADING_RE.match(chunk["text"].split("\n\n")[-1])
+    assert chunks[0]["text"] == "# Short\n\nA brief note."
+    assert chunks[1]["text"].startswith("# Long\n\n")
+
+
+def test_short_sections_share_a_chunk(word_tokens):
+    text = "# One\n\nFirst short section.\n\n# Two\n\nSecond short section."
+    chunks = chunk_pages([(1, text)], max_tokens=40, overlap_tokens=8)
+    assert [c["text"] for c in chunks] == [text]
+
+
+def test_overlap_tail_takes_whole_sentences_or_cuts_tokens(word_tokens):
+    texts = ["First one here. Second one here.", "Third one here. Fourth one here."]
+    assert overlap_tail(texts, 6) == "Third one here. Fourth one here."
+    assert overlap_tail(texts, 7) == "Third one here. Fourth one here."
+    expected = "Second one here.\n\nThird one here. Fourth one here."
+    assert overlap_tail(texts, 9) == expected
+    assert overlap_tail(["one two three four five six"], 2) == "five six"
+    assert overlap_tail(texts, 0) == ""
@@ -0,0 +1,83 @@
+"""
+Knowledge base lookups must not hold up the audio relay of other calls
+served by the same worker.
+"""
+
+import asyncio
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import main
+
+LOOKUPS = 20
+LOOKUP_STEP = 0.2  # seconds spent in each awaited client call
+FRAME = 0.02  # Twilio sends 20 ms frames
+MAX_LATENESS = 0.015  # over the frame interval, on a loaded test runner
+
+
+@pytest.fixture
+def slow_clients(monkeypatch):
+    async def embed(text):
+        await asyncio.sleep(LOOKUP_STEP)
+        return np.ones(8, dtype=np.float32)
+
+    async def query_points(**kwargs):
+        await asyncio.sleep(LOOKUP_STEP)
+        hit = SimpleNamespace(id=1, score=0.9, payload={"text": "Rest and fluids."})
+        return SimpleNamespace(points=[hit])
+
+    async def create(**kwargs):
+        await asyncio.sleep(LOOKUP_STEP)
+        message = SimpleNamespace(content="Rest and drink fluids.")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+    async def get_or_compute(canonical, embedding, compute):
+        return await compute()
+
+    monkeypatch.setattr(main.embedding_service, "embed", embed)
+    monkeypatch.setattr(main.vectordb_client, "query_points", query_points)
+    monkeypatch.setattr(main.client_openai.chat.completions, "create", create)
+    monkeypatch.setattr(main.answer_cache, "get_or_compute", get_or_compute)
+    monkeypatch.setattr(main, "build_context_messages", lambda *args: [])
+    monkeypatch.setattr(main, "bm25_index", None)
+    monkeypatch.setattr(main, "RAG_BACKEND", "qdrant")
+
+
+async def relay_frames(duration):
+    """Lateness of each frame of a simulated call relaying audio every 20 ms."""
+    lateness = []
+    loop = asyncio.get_running_loop()
+    due = loop.time()
+    end = due + duration
+    while due < end:
+        due += FRAME
+        await asyncio.sleep(max(0.0, due - loop.time()))
+        lateness.append(loop.time() - due)
+    return lateness
+
+
+def test_lookups_do_not_delay_other_calls(slow_clients):
+    async def run():
+        idle = await relay_frames(0.5)
+        started = time.monotonic()
+        lookups = asyncio.gather(
+            *(
+                main.get_additional_context(
+                    f"What helps a cough, question {i}?", "sk-test", f"session-{i}"
+                )
+                for i in range(LOOKUPS)
+            )
+        )
+        busy = await relay_frames(3 * LOOKUP_STEP)
+        answers = await lookups
+        return idle, busy, answers, time.monotonic() - started
+
+    idle, busy, answers, elapsed = asyncio.run(run())
+
+    assert answers == ["Rest and drink fluids."] * LOOKUPS
+    # The lookups overlapped instead of running one after another
+    assert elapsed < 2 * 3 * LOOKUP_STEP
+    assert max(busy) < max(idle) + MAX_LATENESS
@@ -0,0 +1,43 @@
+from src.utils.extractive import extractive_answer, split_sentences
+
+TEXT = (
+    "Bronchitis is inflammation of the airways. It often follows a cold."
+    " A cough from bronchitis can last three weeks. Rest and fluids help"
+    " most people recover. See a doctor if you cough up blood!"
+)
+
+
+def test_split_sentences():
+    assert split_sentences("One. Two?  Three!\nFour") == [
+        "One.",
+        "Two?",
+        "Three!",
+        "Four",
+    ]
+    assert split_sentences("  ") == []
+
+
+def test_picks_the_sentences_sharing_most_terms_in_text_order():
+    answer = extractive_answer("How long does a bronchitis cough last?", TEXT)
+    assert answer == (
+        "Bronchitis is inflammation of the airways."
+        " A cough from bronchitis can last three weeks."
+    )
+
+
+def test_single_sentence_when_asked():
+    answer = extractive_answer("cough blood", TEXT, max_sentences=1)
+    assert answer == "See a doctor if you cough up blood!"
+
+
+def test_falls_back_to_the_opening_without_shared_terms():
+    answer = extractive_answer("zzz", TEXT)
+    assert answer == (
+        "Bronchitis is inflammation of the airways. It often follows a cold."
+    )
+
+
+def test_long_answers_are_cut_to_max_words():
+    answer = extractive_answer("bronchitis cough", TEXT, max_words=5)
+    assert answer == "Bronchitis is inflammation of the..."
+    assert extractive_answer("cough", "") == ""
@@ -0,0 +1,74 @@
+from src.utils.prompt_packer import OLD_TURN_TOKENS, clean_history, pack_messages
+
+PERSONA = "You are a doctor."
+QUERY = "What helps a cough?"
+
+
+def words(word, n):
+    return " ".join([word] * n)
+
+
+def test_clean_history_drops_repeats_other_roles_and_the_query():
+    history = [
+        {"role": "system", "content": "Instructions"},
+        {"role": "user", "content": "I have a cough."},
+        {"role": "user", "content": "I have a cough. "},
+        {"role": "assistant", "content": "Since when?"},
+        {"role": "tool", "content": "{}"},
+        {"role": "user", "content": QUERY},
+    ]
+    assert clean_history(history, QUERY) == [
+        {"role": "user", "content": "I have a cough."},
+        {"role": "assistant", "content": "Since when?"},
+    ]
+
+
+def test_contexts_go_by_score_and_small_remainders_are_dropped(word_tokens):
+    contexts = [(words("alpha", 100), 0.5), (words("beta", 30), 0.9)]
+    contexts.append((words("gamma", 30), 0.7))
+    messages, stats = pack_messages(PERSONA, QUERY, [], contexts, budget=120)
+
+    # 16 tokens of persona and query leave 100: beta and gamma fit, and the
+    # 38 left for alpha are under MIN_CONTEXT_TOKENS
+    assert messages[1]["content"] == (
+        "Retrieved Context: " + words("beta", 30) + "\n" + words("gamma", 30)
+    )
+    assert stats["contexts"] == 2
+    assert stats["tokens"] <= 120
+
+
+def test_last_context_is_cut_to_fit(word_tokens):
+    contexts = [(words("alpha", 100), 0.5), (words("beta", 30), 0.9)]
+    messages, stats = pack_messages(PERSONA, QUERY, [], contexts, budget=130)
+
+    alpha = messages[1]["content"].split("\n")[1]
+    assert alpha.endswith(" ...")
+    assert 50 <= len(alpha.split()) - 1 < 100
+    assert stats["contexts"] == 2
+    assert stats["tokens"] <= 130
+
+
+def test_recent_turns_verbatim_older_turns_cut_then_dropped(word_tokens):
+    older = [
+        {"role": ("user", "assistant")[i % 2], "content": words(f"old{i}", 60)}
+        for i in range(6)
+    ]
+    recent = [
+        {"role": ("user", "assistant")[i % 2], "content": words(f"new{i}", 20)}
+        for i in range(4)
+    ]
+    messages, stats = pack_messages(
+        PERSONA, QUERY, older + recent, [], budget=310, recent_turns=4, summary="Flu."
+    )
+
+    assert messages[0]["content"] == PERSONA
+    assert messages[1]["content"].startswith("Retrieved Context:")
+    assert messages[2] == {"role": "system", "content": "Earlier in this call: Flu."}
+    assert messages[-5:-1] == recent
+    assert messages[-1] == {"role": "user", "content": QUERY}
+    kept_older = messages[3:-5]
+    firsts = [m["content"].split()[0] for m in kept_older]
+    assert firsts == ["old2", "old3", "old4", "old5"]
+    assert all(len(m["content"].split()) == OLD_TURN_TOKENS + 1 for m in kept_older)
+    assert stats["turns"] == 8 and stats["dropped_turns"] == 2
+    assert stats["tokens"] <= 310
@@ -0,0 +1,92 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from src.utils.semantic_cache import SemanticCache, caller_words, canonical_query
+
+
+def test_unquoted_keeps_every_sentence_before_the_paraphrase():
+    query = (
+        "A user asked: I've had a cough for three weeks. What could it be?"
+        " They are concerned about TB and want to know the causes."
+    )
+    expected = "i've had a cough for three weeks. what could it be"
+    assert canonical_query(query) == expected
+
+
+def test_follow_ups_with_the_same_opening_get_different_keys():
+    opening = (
+        "Please use your knowledge base."
+        " A user asked: I've had a cough for three weeks."
+    )
+    first = canonical_query(f"{opening} What could it be? They are worried.")
+    second = canonical_query(f"{opening} Should I see a doctor? Provide advice.")
+    assert first != second
+    assert second.endswith("should i see a doctor")
+
+
+@pytest.mark.parametrize(
+    "query, expected",
+    [
+        (
+            "A user asked: 'My kids' coughs won't stop.' Please advise.",
+            "my kids' coughs won't stop",
+        ),
+        (
+            "A user asked: 'Is James' asthma inhaler safe for kids?' Explain.",
+            "is james' asthma inhaler safe for kids",
+        ),
+        (
+            "A user asked: 'I don't sleep because of my cough.' Explain.",
+            "i don't sleep because of my cough",
+        ),
+        (
+            'A user asked: "Can pneumonia spread at home?" Include details.',
+            "can pneumonia spread at home",
+        ),
+    ],
+)
+def test_quoted_words_survive_apostrophes(query, expected):
+    assert canonical_query(query) == expected
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "A user asked: 'Is it contagious?' The user was told they have pneumonia.",
+        "A user asked: Is that serious? They mentioned chest pain earlier.",
+        "A user asked: Tell me more. Is it serious? They asked about bronchitis.",
+    ],
+)
+def test_anaphoric_words_keep_the_expansion(query):
+    assert caller_words(query) is None
+    rest = query.split(":", 1)[1]
+    assert canonical_query(query) == " ".join(rest.lower().split()).strip(" .?!,;:")
+
+
+def test_anaphora_after_the_topic_is_named_stays_short():
+    query = "A user asked: My son has asthma. Is it genetic? Explain inheritance."
+    assert caller_words(query) == "My son has asthma. Is it genetic?"
+
+
+def test_queries_without_the_prefix_are_left_whole():
+    query = "What helps a Cough at night?"
+    assert canonical_query(query) == "what helps a cough at night"
+    lead_in = "Please use your knowledge base: what helps a cough at night?"
+    assert canonical_query(lead_in) == "what helps a cough at night"
+
+
+def test_begin_hands_a_pending_query_to_its_first_leader():
+    cache = SemanticCache("test")
+
+    async def run():
+        assert cache.begin("cough") is None
+        pending = cache.begin("  Cough")
+        assert pending is not None
+        assert cache.begin("cough") is pending
+        await cache.complete("cough", np.ones(4, dtype=np.float32), "Rest.")
+        return await pending
+
+    assert asyncio.run(run()) == "Rest."
+    assert cache.stats()["inflight"] == 0
@@ -0,0 +1,34 @@
+import asyncio
+
+from src.utils.session_store import InMemorySessionStore
+from src.utils.sessions import SessionRegistry
+
+
+def test_memory_store_evicts_numbers_and_turns_with_the_session():
+    async def run():
+        store = InMemorySessionStore(max_sessions=2)
+        for n in range(5):
+            await store.create(f"session-{n}", f"+1555000000{n}", 0)
+        await store.append_turn("never-created", {"role": "user", "content": "hi"})
+        return store
+
+    store = asyncio.run(run())
+    assert list(store._records) == ["session-3", "session-4"]
+    assert set(store._turns) == {"session-3", "session-4"}
+    assert set(store._by_number.values()) == {"session-3", "session-4"}
+
+
+def test_released_session_keeps_its_stored_record():
+    async def summarize(summary, turns):
+        return summary
+
+    async def run():
+        registry = SessionRegistry(summarize)
+        await registry.create("call", "+15550000001")
+        await registry.mark_transfer("call")
+        registry.release("call")
+        return registry, await registry.find("+15550000001")
+
+    registry, record = asyncio.run(run())
+    assert registry.get("call") is None
+    assert record["session_id"] == "call" and record["transfer"]
@@ -0,0 +1,31 @@
+import pytest
+
+from src.utils.audio import FRAME_MS, load_ulaw, ulaw_frames
+from src.utils.silence_gate import gate_report, synthesize_call
+
+SEGMENTS = ((1.0, False), (1.2, True), (2.0, False), (0.8, True), (1.5, False))
+
+
+@pytest.fixture(scope="module")
+def call_frames(tmp_path_factory):
+    path = tmp_path_factory.mktemp("audio") / "call.wav"
+    synthesize_call(str(path), SEGMENTS)
+    return ulaw_frames(load_ulaw(str(path)))
+
+
+# The gate's defaults, and the padding main.py gives it around server VAD
+@pytest.mark.parametrize("prefix_ms, hangover_ms", [(300, 800), (400, 800)])
+def test_gate_keeps_speech_and_drops_silence(call_frames, prefix_ms, hangover_ms):
+    report = gate_report(
+        call_frames, threshold=300, prefix_ms=prefix_ms, hangover_ms=hangover_ms
+    )
+
+    speech_ms = sum(seconds for seconds, voiced in SEGMENTS if voiced) * 1000
+    assert report["voiced"] == speech_ms // FRAME_MS
+    assert report["voiced_lost"] == 0
+    assert report["prefix_lost"] == 0
+    assert report["in_order"]
+    # Every gap is longer than the prefix and hangover kept around speech
+    leading_silence = 1000 // FRAME_MS - prefix_ms // FRAME_MS
+    gap = 2000 // FRAME_MS - (prefix_ms + hangover_ms) // FRAME_MS
+    assert report["dropped"] >= leading_silence + gap